@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_timer
+        connection_created.connect(install_query_timer, dispatch_uid='api.metrics.install_query_timer')
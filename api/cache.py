@@ -0,0 +1,60 @@
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from .facilities import current_database, current_facility, reading_replica
+from .metrics import cache_stats
+
+# Serialized per-patient list responses; see CACHES in settings
+PATIENT_JSON_CACHE = 'patient_json'
+
+
+def dashboard_cache_key(day, replica=False):
+    # Replica-built snapshots get their own key: one read before the next
+    # sync_replicas must not re-cache old state under the key a write drops
+    source = 'replica:' if replica else ''
+    return f"dashboard:{current_facility()}:{source}{day.isoformat()}"
+
+
+async def aget_dashboard_snapshot(abuild, day=None):
+    """
+    Return the current facility's dashboard payload for `day`, served from the cache when
+    DASHBOARD_CACHE_TIMEOUT is set. `await abuild(day)` produces a fresh snapshot.
+    """
+    day = day or date.today()
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return await abuild(day)
+
+    key = dashboard_cache_key(day, replica=reading_replica())
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await abuild(day)
+        await cache.aset(key, snapshot, timeout)
+    return snapshot
+
+
+def invalidate_dashboard(day=None):
+    # Only today's snapshot is ever served, so that is the only key to drop.
+    # Deferred to commit so a concurrent read can't re-cache uncommitted state.
+    key = dashboard_cache_key(day or date.today())
+    transaction.on_commit(lambda: cache.delete(key), using=current_database())
+
+
+async def aget_patient_json(name, etag, abuild):
+    """
+    Response body for a per-patient resource, keyed by its ETag. The ETag
+    carries the patient's data version, which triggers bump on every write
+    to the patient's medications, doses and records, so a changed resource
+    simply stops being looked up; nothing has to be deleted, and the LRU
+    bound reclaims the stale entries. `await abuild()` renders a miss.
+    """
+    patient_json = caches[PATIENT_JSON_CACHE]
+    # Ids and versions repeat across facility databases
+    key = f"{current_facility()}:{name}:" + etag.strip('"')
+    body = await patient_json.aget(key)
+    cache_stats.record(name, hit=body is not None)
+    if body is None:
+        body = await abuild()
+        await patient_json.aset(key, body)
+    return body
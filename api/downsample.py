@@ -0,0 +1,38 @@
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of (x, y) points sorted by x.
+
+    Keeps the first and last points and, from each of `threshold - 2` equal
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket. This preserves
+    peaks and troughs that plain striding would drop. Runs in one pass.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the triangle's third vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / span
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / span
+
+        ax, ay = points[a]
+        max_area = -1.0
+        next_a = int(i * every) + 1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(points[next_a])
+        a = next_a
+
+    sampled.append(points[-1])
+    return sampled
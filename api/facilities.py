@@ -0,0 +1,261 @@
+"""
+Facility sharding: each care home's patients, medications and records live
+in their own database (settings.FACILITIES). The facility a request works on
+is held in a context variable, set by api.middleware.FacilityMiddleware, and
+FacilityRouter sends every api query to that facility's database.
+
+A facility database may also have a read replica (settings.REPLICA_DATABASES)
+that the heavy read-only views marked with reads_from_replica are served
+from until they write.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+FACILITY_HEADER = 'X-Facility'
+
+_current = ContextVar('facility', default=None)
+_replica_reads = ContextVar('replica_reads', default=None)
+_pool = ThreadPoolExecutor(max_workers=settings.FACILITY_FANOUT_WORKERS, thread_name_prefix='facility')
+
+
+def facilities():
+    return list(settings.FACILITIES)
+
+
+def facility_database(facility):
+    """Database alias of a facility; raises ValueError for unknown ones."""
+    try:
+        return settings.FACILITIES[facility]
+    except KeyError:
+        raise ValueError(f"Unknown facility: {facility}")
+
+
+def selected_facility():
+    """The facility the current request asked for, or None if it didn't pick one."""
+    return _current.get()
+
+
+def current_facility():
+    return _current.get() or facilities()[0]
+
+
+def current_database():
+    return facility_database(current_facility())
+
+
+def select_facility(facility):
+    facility_database(facility)
+    return _current.set(facility)
+
+
+def release_facility(token):
+    _current.reset(token)
+
+
+@contextmanager
+def using_facility(facility):
+    token = select_facility(facility)
+    try:
+        yield
+    finally:
+        release_facility(token)
+
+
+def iterate_in_facility(facility, iterator):
+    """
+    Items of a lazy, database-backed iterator, each produced with `facility`
+    selected; for streamed responses, which run after the request's own
+    selection has ended.
+    """
+    while True:
+        with using_facility(facility):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def iterate_in_context(iterator):
+    """
+    Items of `iterator`, each produced in a copy of the current context:
+    streamed response bodies keep the request's facility and replica
+    routing after the view has returned.
+    """
+    # Captured now, while the request's selections are still in place
+    context = contextvars.copy_context()
+
+    def items():
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    return items()
+
+
+class ReplicaReads:
+    """Whether this request's reads may still go to a replica; shared by every context it spawns."""
+    __slots__ = ('allowed',)
+
+    def __init__(self):
+        self.allowed = True
+
+
+def allow_replica_reads():
+    return _replica_reads.set(ReplicaReads())
+
+
+def end_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+def reading_replica():
+    """Whether api reads here go to the current facility's replica."""
+    reads = _replica_reads.get()
+    return reads is not None and reads.allowed and current_database() in settings.REPLICA_DATABASES
+
+
+def reads_from_replica(view):
+    """
+    Serve a view's GET/HEAD requests from the facility replicas, which lag
+    the primary until the next sync_replicas. Only for heavy reads that can
+    show slightly old data; per-patient, ETag-validated and sync views stay
+    on the primary so a client never revalidates against a stale copy.
+    """
+    def replica_safe(request):
+        return request.method in ('GET', 'HEAD')
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not replica_safe(request):
+                return await view(request, *args, **kwargs)
+            token = allow_replica_reads()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                end_replica_reads(token)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not replica_safe(request):
+                return view(request, *args, **kwargs)
+            token = allow_replica_reads()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                end_replica_reads(token)
+    return wrapper
+
+
+def refresh_replica(primary):
+    """
+    Copy a primary database onto its replica with the SQLite backup API, in
+    one step, so replica readers see either the old copy or the new one.
+    """
+    source, target = connections[primary], connections[settings.REPLICA_DATABASES[primary]]
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+def all_facilities(view):
+    """
+    Mark a view that may run without a selected facility: it covers every
+    facility (or none). Every other api view needs X-Facility as soon as more
+    than one facility is configured, since ids repeat across facilities.
+    """
+    view.all_facilities = True
+    return view
+
+
+def requires_selection(view):
+    return (
+        len(settings.FACILITIES) > 1 and selected_facility() is None
+        and view.__module__.partition('.')[0] == 'api' and not getattr(view, 'all_facilities', False)
+    )
+
+
+def fans_out():
+    """Whether a cross-facility read should cover every facility."""
+    return selected_facility() is None and len(settings.FACILITIES) > 1
+
+
+async def afan_out(func, *args):
+    """
+    {facility: func(*args)} for every facility, each call run on the shared
+    thread pool with its facility selected, so the shards are read in
+    parallel rather than one after another on the request's thread.
+    """
+    loop = asyncio.get_running_loop()
+
+    def run(facility):
+        # Pool threads hold their own connections; recycle them like a request would
+        close_old_connections()
+        with using_facility(facility):
+            return func(*args)
+
+    names = facilities()
+    # Each call gets a copy of the request context, so its queries still
+    # count towards the request's Server-Timing
+    results = await asyncio.gather(*(
+        loop.run_in_executor(_pool, contextvars.copy_context().run, run, facility) for facility in names
+    ))
+    return dict(zip(names, results))
+
+
+class FacilityRouter:
+    """
+    api models go to the current facility's database, or to the database an
+    instance was loaded from; everything else (auth, sessions, admin) stays
+    on the default database.
+
+    Inside allow_replica_reads() (reads_from_replica views), reads go to the
+    facility's replica until the first write, and to the primary from then
+    on so the request reads its own writes.
+    """
+    @staticmethod
+    def _primary(database):
+        for primary, replica in settings.REPLICA_DATABASES.items():
+            if database == replica:
+                return primary
+        return database
+
+    def _route(self, model, instance=None, **hints):
+        if model._meta.app_label != 'api':
+            return None
+        if instance is not None and instance._state.db:
+            return self._primary(instance._state.db)
+        return current_database()
+
+    def db_for_read(self, model, **hints):
+        database = self._route(model, **hints)
+        reads = _replica_reads.get()
+        if database is None or reads is None or not reads.allowed:
+            return database
+        return settings.REPLICA_DATABASES.get(database, database)
+
+    def db_for_write(self, model, **hints):
+        database = self._route(model, **hints)
+        if database is not None and (reads := _replica_reads.get()) is not None:
+            reads.allowed = False
+        return database
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == 'api' and obj2._meta.app_label == 'api':
+            return self._primary(obj1._state.db) == self._primary(obj2._state.db)
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if app_label == 'api':
+            return db in settings.FACILITIES.values()
+        return db == 'default'
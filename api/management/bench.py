@@ -0,0 +1,239 @@
+"""
+Shared helpers for the benchmark management commands.
+"""
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from api.facilities import FACILITY_HEADER, facilities, refresh_replica
+from api.metrics import percentile
+from api.models import Patient, Medication
+
+
+def summarize(latencies, duration, errors=0):
+    """Throughput and latency percentiles (ms) for one series of requests."""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1) if duration else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def succeeded(response):
+    return 200 <= response.status_code < 300 or response.status_code == 304
+
+
+class FacilityAsyncClient(AsyncClient):
+    """
+    AsyncClient that sends its constructor headers on every request: the
+    stock one puts them in the ASGI scope, where the request never sees them.
+    """
+    def __init__(self, headers=None, **defaults):
+        super().__init__(**defaults)
+        self.default_headers = headers or {}
+
+    def generic(self, *args, headers=None, **kwargs):
+        return super().generic(*args, headers={**self.default_headers, **(headers or {})}, **kwargs)
+
+
+def facility_client(client_class=Client):
+    """A test client naming the default facility, as a tablet's requests do."""
+    return client_class(headers={FACILITY_HEADER: facilities()[0]})
+
+
+@contextmanager
+def scratch_database(directory, label, **overrides):
+    """
+    Point every facility's database alias at a fresh, migrated SQLite file
+    for the duration of the block, so benchmarks never touch the real
+    databases, and cross-facility views find theirs. The default facility's
+    is `<label>.sqlite3`. Reads stay on them too: configured replicas are
+    copies of the real databases (see scratch_replica for a scratch one).
+    """
+    aliases = list(settings.FACILITIES.values())
+    originals = {alias: dict(connections[alias].settings_dict) for alias in aliases}
+    connections.close_all()
+    for alias in aliases:
+        name = f'{label}.sqlite3' if alias == 'default' else f'{label}_{alias}.sqlite3'
+        connections[alias].settings_dict.update(NAME=str(Path(directory) / name), **overrides)
+    try:
+        with override_settings(REPLICA_DATABASES={}):
+            for alias in aliases:
+                call_command('migrate', database=alias, verbosity=0)
+            yield connections['default']
+    finally:
+        connections.close_all()
+        for alias, original in originals.items():
+            connections[alias].settings_dict.clear()
+            connections[alias].settings_dict.update(original)
+
+
+@contextmanager
+def scratch_replica(directory, label, primary='default'):
+    """
+    A read replica of the scratch `primary` database for the duration of the
+    block: registered as `<primary>_replica` (or repointed, if settings
+    already define it), filled with the backup API and routed to.
+    """
+    alias = f'{primary}_replica'
+    added = alias not in connections.settings
+    if added:
+        connections.settings[alias] = dict(connections[primary].settings_dict)
+    replica = connections[alias]
+    original = dict(replica.settings_dict)
+    connections.close_all()
+    replica.settings_dict.update(NAME=str(Path(directory) / f'{label}.replica.sqlite3'))
+    try:
+        with override_settings(REPLICA_DATABASES={**settings.REPLICA_DATABASES, primary: alias}):
+            refresh_replica(primary)
+            yield replica
+    finally:
+        connections.close_all()
+        replica.settings_dict.clear()
+        replica.settings_dict.update(original)
+        if added:
+            del connections[alias]
+            del connections.settings[alias]
+
+
+def seed_patients(count, meds_per_patient=3):
+    """Minimal roster for benchmarks; returns the new patient ids."""
+    patients = Patient.objects.bulk_create([
+        Patient(name=f"Bench Patient {i}", age=65 + i % 30, gender="Female")
+        for i in range(count)
+    ])
+    Medication.objects.bulk_create([
+        Medication(patient=patient, name=f"Med {m}", dose="1 tab", timing="morning")
+        for patient in patients for m in range(meds_per_patient)
+    ])
+    return [patient.id for patient in patients]
+
+
+class HttpResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.streaming = False
+
+
+class HttpClient:
+    """
+    Minimal stand-in for the test Client that talks to a running server,
+    so the same request functions can drive either. Requests name
+    `facility` in the X-Facility header, if given.
+    """
+    def __init__(self, base_url, facility=None):
+        self.base_url = base_url.rstrip('/')
+        self.facility = facility
+
+    def request(self, method, path, data=None, content_type=None):
+        body = None
+        url = self.base_url + path
+        if method == 'GET' and data:
+            url += '?' + urllib.parse.urlencode(data)
+        elif data is not None:
+            body = data.encode() if isinstance(data, str) else data
+        request = urllib.request.Request(url, data=body, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        if self.facility:
+            request.add_header(FACILITY_HEADER, self.facility)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return HttpResponse(response.status, response.read())
+        except urllib.error.HTTPError as error:
+            return HttpResponse(error.code, error.read())
+
+    def get(self, path, data=None):
+        return self.request('GET', path, data)
+
+    def post(self, path, data=None, content_type=None):
+        return self.request('POST', path, data, content_type)
+
+    def patch(self, path, data=None, content_type=None):
+        return self.request('PATCH', path, data, content_type)
+
+
+def run_clients(workers, duration, client_factory=facility_client):
+    """
+    Run `workers` (a list of (name, request_fn) pairs) in parallel threads for
+    `duration` seconds. Each request_fn gets its own client from
+    `client_factory` (a test Client for the default facility by default) and
+    returns the response. Returns {name: summary} aggregated per worker
+    name; any response other than 2xx or 304 counts as an error.
+    """
+    deadline = time.perf_counter() + duration
+    results = {name: {'latencies': [], 'errors': 0} for name, _ in workers}
+    lock = threading.Lock()
+
+    def loop(name, request_fn):
+        client = client_factory()
+        latencies, errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = request_fn(client)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+                latencies.append(time.perf_counter() - started)
+                if not succeeded(response):
+                    errors += 1
+                # The test client suppresses the request_finished cleanup a
+                # real server runs, so apply CONN_MAX_AGE here instead.
+                close_old_connections()
+        finally:
+            connections.close_all()
+        with lock:
+            results[name]['latencies'].extend(latencies)
+            results[name]['errors'] += errors
+
+    threads = [threading.Thread(target=loop, args=worker) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        name: summarize(data['latencies'], duration, data['errors'])
+        for name, data in results.items()
+    }
+
+
+def arun_clients(workers, duration):
+    """
+    ASGI counterpart of run_clients: each worker is a coroutine loop on one
+    event loop, and each request_fn is an async callable taking an AsyncClient.
+    """
+    results = {name: {'latencies': [], 'errors': 0} for name, _ in workers}
+
+    async def loop(name, request_fn, deadline):
+        client = facility_client(FacilityAsyncClient)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await request_fn(client)
+            results[name]['latencies'].append(time.perf_counter() - started)
+            if not succeeded(response):
+                results[name]['errors'] += 1
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(loop(name, fn, deadline) for name, fn in workers))
+
+    asyncio.run(main())
+    connections.close_all()
+    return {
+        name: summarize(data['latencies'], duration, data['errors'])
+        for name, data in results.items()
+    }
@@ -0,0 +1,68 @@
+import json
+import random
+import tempfile
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from api.models import DailyRecord
+from api.management.bench import arun_clients, run_clients, scratch_database, seed_patients
+
+
+class Command(BaseCommand):
+    help = 'Compares read endpoint throughput and latency served through the WSGI and ASGI handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per handler')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--patients', type=int, default=300)
+        parser.add_argument('--days', type=int, default=30, help='Days of daily records per patient')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp, override_settings(DASHBOARD_CACHE_TIMEOUT=0):
+            with scratch_database(tmp, 'asgi'):
+                patient_ids = seed_patients(options['patients'])
+                self.seed_records(patient_ids, options['days'])
+                paths = self.read_paths(patient_ids, options['days'])
+
+                def wsgi_request(client):
+                    return client.get(random.choice(paths))
+
+                async def asgi_request(client):
+                    return await client.get(random.choice(paths))
+
+                workers = options['concurrency']
+                results['wsgi'] = run_clients([('reads', wsgi_request)] * workers, options['duration'])['reads']
+                results['asgi'] = arun_clients([('reads', asgi_request)] * workers, options['duration'])['reads']
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'handler':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for handler, stats in results.items():
+            self.stdout.write(
+                f"{handler:<8} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+                f"{stats['p99_ms']:>8} {stats['errors']:>7}"
+            )
+
+    def seed_records(self, patient_ids, days):
+        today = date.today()
+        DailyRecord.objects.bulk_create([
+            DailyRecord(patient_id=patient_id, date=today - timedelta(days=d), weight=60.0, bp="120/80")
+            for patient_id in patient_ids for d in range(days)
+        ], batch_size=1000)
+
+    def read_paths(self, patient_ids, days):
+        today = date.today()
+        sample = random.sample(patient_ids, min(len(patient_ids), 20))
+        report = f"from_date={(today - timedelta(days=days)).isoformat()}&to_date={today.isoformat()}"
+        paths = ['/api/dashboard', '/api/patients?limit=50']
+        for patient_id in sample:
+            paths += [
+                f'/api/patients/{patient_id}',
+                f'/api/patients/{patient_id}/records',
+                f'/api/patients/{patient_id}/medicines',
+                f'/api/reports?{report}&patient_id={patient_id}',
+            ]
+        return paths
@@ -0,0 +1,249 @@
+import json
+import os
+import random
+import tempfile
+from contextlib import contextmanager, nullcontext
+from datetime import date, timedelta
+from pathlib import Path
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+from django.utils import timezone
+from api.facilities import facilities
+from api.management.bench import HttpClient, facility_client, run_clients, scratch_database
+
+# Name and complaint prefixes of the kind nurses type, from seed_data's vocabulary
+SEARCH_TERMS = ['ra', 'sita', 'kum', 'singh dev', 'hyper', 'joint pain', 'diab', 'lal']
+
+# Request builder per URL name in api/urls.py; each takes (client, ctx)
+ROUTES = {
+    'patient_list': lambda client, ctx: client.get('/api/patients', {'limit': 50}),
+    'patient_search': lambda client, ctx: client.get('/api/patients/search', {'q': ctx.search_term()}),
+    'patient_detail': lambda client, ctx: client.get(f"/api/patients/{ctx.patient()}"),
+    'patient_records': lambda client, ctx: client.get(f"/api/patients/{ctx.patient()}/records"),
+    'patient_medicines': lambda client, ctx: client.get(f"/api/patients/{ctx.patient()}/medicines"),
+    'patient_trends': lambda client, ctx: client.get(f"/api/patients/{ctx.patient()}/trends"),
+    'mark_medications_given': lambda client, ctx: ctx.post_json(
+        client, '/api/medications/mark_given', {'patient_id': ctx.patient(), 'timing': 'morning'}
+    ),
+    'mark_medication_given': lambda client, ctx: client.patch(f"/api/medications/mark_given/{ctx.medication()}"),
+    'daily_record': lambda client, ctx: ctx.post_json(client, '/api/daily/record', ctx.vitals()),
+    'daily_records_bulk': lambda client, ctx: ctx.post_json(
+        client, '/api/daily/records/bulk', [ctx.vitals() for _ in range(20)]
+    ),
+    'dashboard': lambda client, ctx: client.get('/api/dashboard'),
+    'calendar_events': lambda client, ctx: client.get('/api/calendar/events', {
+        'patient_id': ctx.patient(), 'start': ctx.today.isoformat(),
+        'end': (ctx.today + timedelta(days=6)).isoformat()
+    }),
+    'complete_event': lambda client, ctx: client.post(
+        f"/api/calendar/events/med-{ctx.medication()}-{ctx.past_day():%Y%m%d}/complete"
+    ),
+    'reports_data': lambda client, ctx: client.get('/api/reports', {
+        'patient_id': ctx.patient(), 'from_date': (ctx.today - timedelta(days=30)).isoformat(),
+        'to_date': ctx.today.isoformat()
+    }),
+    # A tablet catching up from the cursor it held when the run started
+    'sync': lambda client, ctx: client.get('/api/sync', {'since': ctx.sync_cursor}),
+    'metrics': lambda client, ctx: client.get('/api/_metrics'),
+}
+
+# Routes that change data; against a live server (--url) they only run with --allow-writes
+WRITE_ROUTES = {
+    'mark_medications_given', 'mark_medication_given', 'daily_record', 'daily_records_bulk', 'complete_event',
+}
+
+# Baseline meta that must match for latencies to be comparable
+COMPARABLE_META = ('target', 'patients', 'days', 'concurrency')
+
+
+class RequestContext:
+    """Ids discovered from the API, plus random request parameters."""
+    def __init__(self, patient_ids, medication_ids, sync_cursor, days):
+        self.patient_ids = patient_ids
+        self.medication_ids = medication_ids
+        self.sync_cursor = sync_cursor
+        self.days = max(days, 1)
+        self.today = date.today()
+
+    def patient(self):
+        return random.choice(self.patient_ids)
+
+    def medication(self):
+        return random.choice(self.medication_ids)
+
+    def search_term(self):
+        return random.choice(SEARCH_TERMS)
+
+    def past_day(self):
+        return self.today - timedelta(days=random.randrange(self.days))
+
+    def vitals(self):
+        return {
+            'patient_id': self.patient(),
+            'date': self.past_day().isoformat(),
+            'weight': round(random.uniform(50, 90), 1),
+            'bp': f"{random.randint(110, 160)}/{random.randint(70, 100)}",
+        }
+
+    @staticmethod
+    def post_json(client, path, data):
+        return client.post(path, json.dumps(data), content_type='application/json')
+
+
+@contextmanager
+def seeded_database(patients, days, seed):
+    with tempfile.TemporaryDirectory() as tmp, scratch_database(tmp, 'endpoints'):
+        with open(os.devnull, 'w') as devnull:
+            call_command('seed_data', patients=patients, days=days, seed=seed, stdout=devnull)
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests every route in api/urls.py, offline against a seeded scratch database '
+        '(or a running server with --url), and compares the results with a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=3.0, help='Seconds per route')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--patients', type=int, default=500, help='Seeded patients (offline only)')
+        parser.add_argument('--days', type=int, default=90, help='Days of seeded history (offline only)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--facility', help='X-Facility to send with --url (default: the first configured one)')
+        parser.add_argument('--route', action='append', help='Only these URL names (repeatable)')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='With --url, also run the routes that change data')
+        parser.add_argument('--save', help='Write the results to this JSON baseline file')
+        parser.add_argument('--baseline', help='Compare against this JSON baseline file')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percent slowdown (p95 latency or throughput) flagged as a regression')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        url_names = [pattern.name for pattern in get_resolver('api.urls').url_patterns if pattern.name]
+        missing = set(url_names) - set(ROUTES)
+        if missing:
+            raise CommandError(f"No benchmark request for: {', '.join(sorted(missing))}")
+        routes = options['route'] or url_names
+        unknown = set(routes) - set(url_names)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+        if options['url'] and not options['allow_writes']:
+            # A live server holds real patients; don't log doses or vitals into it by default
+            if options['route'] and WRITE_ROUTES & set(routes):
+                raise CommandError(
+                    f"Routes that change data: {', '.join(sorted(WRITE_ROUTES & set(routes)))}; "
+                    "pass --allow-writes to run them against a server"
+                )
+            routes = [name for name in routes if name not in WRITE_ROUTES]
+
+        meta = {
+            'target': options['url'] or 'test-client',
+            'patients': None if options['url'] else options['patients'],
+            'days': options['days'],
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'created': timezone.now().isoformat(),
+        }
+        baseline = json.loads(Path(options['baseline']).read_text()) if options['baseline'] else None
+        if baseline:
+            self.check_baseline(baseline, meta)
+
+        random.seed(options['seed'])
+        if options['url']:
+            facility = options['facility'] or facilities()[0]
+            client_factory = lambda: HttpClient(options['url'], facility)
+            dataset = nullcontext()
+        else:
+            # Offline: the test client against a freshly seeded scratch database
+            client_factory = facility_client
+            dataset = seeded_database(options['patients'], options['days'], options['seed'])
+
+        with dataset:
+            ctx = self.discover(client_factory(), options['days'])
+            results = {}
+            for name in routes:
+                request = ROUTES[name]
+                workers = [(name, lambda client, request=request: request(client, ctx))] * options['concurrency']
+                results[name] = run_clients(workers, options['duration'], client_factory)[name]
+
+        report = {'meta': meta, 'routes': results}
+        if options['save']:
+            Path(options['save']).write_text(json.dumps(report, indent=2) + '\n')
+
+        regressions = self.compare(results, meta, baseline, options['threshold']) if baseline else {}
+        if options['json']:
+            self.stdout.write(json.dumps({**report, 'regressions': regressions}, indent=2))
+        else:
+            self.print_table(results, baseline, regressions)
+        if regressions:
+            raise CommandError(f"{len(regressions)} route(s) regressed beyond {options['threshold']}%")
+
+    def discover(self, client, days):
+        """Patient and medication ids to aim requests at, read through the API itself."""
+        def get(path, data=None):
+            response = client.get(path, data)
+            if response.status_code != 200:
+                raise CommandError(f"{path} returned {response.status_code}: {response.content[:200]!r}")
+            return json.loads(response.content)
+
+        patient_ids = [patient['id'] for patient in get('/api/patients', {'limit': 500})['results']]
+        if not patient_ids:
+            raise CommandError("No patients to benchmark against; seed the database first")
+        medication_ids = []
+        for patient_id in patient_ids[:50]:
+            medication_ids += [medicine['id'] for medicine in get(f'/api/patients/{patient_id}/medicines')]
+        if not medication_ids:
+            raise CommandError("No medications to benchmark against")
+
+        page = get('/api/sync')
+        while page['has_more']:
+            page = get('/api/sync', {'since': page['cursor']})
+        return RequestContext(patient_ids, medication_ids, page['cursor'], days)
+
+    def check_baseline(self, baseline, meta):
+        """Refuse a baseline recorded against a different target or workload."""
+        before = baseline.get('meta', {})
+        mismatched = [
+            f"{key} {before.get(key)!r} != {meta[key]!r}" for key in COMPARABLE_META if before.get(key) != meta[key]
+        ]
+        if mismatched:
+            raise CommandError(f"Baseline is not comparable with this run: {'; '.join(mismatched)}")
+
+    def compare(self, results, meta, baseline, threshold):
+        """Routes slower than the baseline by more than `threshold` percent."""
+        self.check_baseline(baseline, meta)
+        regressions = {}
+        for name, stats in results.items():
+            before = baseline['routes'].get(name)
+            if not before:
+                continue
+            reasons = []
+            if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + threshold / 100):
+                reasons.append(f"p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+            if before['rps'] and stats['rps'] < before['rps'] * (1 - threshold / 100):
+                reasons.append(f"req/s {before['rps']} -> {stats['rps']}")
+            if reasons:
+                regressions[name] = reasons
+        return regressions
+
+    def print_table(self, results, baseline, regressions):
+        self.stdout.write(
+            f"{'route':<24} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+            + (f" {'p95 vs base':>12}" if baseline else "")
+        )
+        for name, stats in results.items():
+            line = (
+                f"{name:<24} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+                f"{stats['p99_ms']:>8} {stats['errors']:>7}"
+            )
+            before = baseline['routes'].get(name) if baseline else None
+            if before and before['p95_ms']:
+                change = (stats['p95_ms'] / before['p95_ms'] - 1) * 100
+                line += f" {change:>+11.1f}%"
+            if name in regressions:
+                line += "  REGRESSION: " + '; '.join(regressions[name])
+            self.stdout.write(line)
@@ -0,0 +1,83 @@
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from api.management.bench import run_clients, scratch_database, scratch_replica
+from api.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks daily_record write latency while large reports run, with the reports '
+        'served by the primary database and then by a read replica'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per setup')
+        parser.add_argument('--readers', type=int, default=2, help='Concurrent report readers')
+        parser.add_argument('--writers', type=int, default=2, help='Concurrent daily_record writers')
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=90, help='Days of history, and of each report')
+        parser.add_argument('--journal-mode', help='SQLite journal mode (default: the configured one)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        if options['journal_mode']:
+            pragmas['journal_mode'] = options['journal_mode']
+        db_options = {
+            **settings.DATABASES['default'].get('OPTIONS', {}),
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+        }
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp, override_settings(DASHBOARD_CACHE_TIMEOUT=0):
+            with scratch_database(tmp, 'replica', OPTIONS=db_options):
+                with open(os.devnull, 'w') as devnull:
+                    call_command('seed_data', patients=options['patients'], days=options['days'], seed=1,
+                                 stdout=devnull)
+                patient_ids = list(Patient.objects.values_list('id', flat=True))
+                setups = [
+                    ('primary', override_settings(REPLICA_DATABASES={})),
+                    ('replica', scratch_replica(tmp, 'replica')),
+                ]
+                for label, setup in setups:
+                    with setup:
+                        results[label] = self.run_setup(patient_ids, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'journal_mode': pragmas['journal_mode'], 'setups': results}, indent=2))
+            return
+        self.stdout.write(f"journal_mode={pragmas['journal_mode']}")
+        self.stdout.write(
+            f"{'reports on':<11} {'op':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for label, ops in results.items():
+            for op, stats in ops.items():
+                self.stdout.write(
+                    f"{label:<11} {op:<8} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+                    f"{stats['p99_ms']:>8} {stats['errors']:>7}"
+                )
+
+    def run_setup(self, patient_ids, options):
+        today = date.today()
+        report = {'from_date': (today - timedelta(days=options['days'])).isoformat(), 'to_date': today.isoformat()}
+
+        def write(client):
+            return client.post('/api/daily/record', json.dumps({
+                'patient_id': random.choice(patient_ids),
+                'date': (today - timedelta(days=random.randrange(options['days']))).isoformat(),
+                'weight': round(random.uniform(50, 90), 1),
+                'bp': f"{random.randint(110, 160)}/{random.randint(70, 100)}",
+            }), content_type='application/json')
+
+        def read(client):
+            return client.get('/api/reports', {**report, 'format': 'csv'})
+
+        workers = [('write', write)] * options['writers'] + [('report', read)] * options['readers']
+        return run_clients(workers, options['duration'])
@@ -0,0 +1,107 @@
+import json
+import tempfile
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from api.models import DailyRecord, Medication
+from api.serializers import DailyRecordSerializer, MedicationSerializer, bp_display, isoformat
+from api.management.bench import scratch_database, seed_patients
+
+
+def legacy_records(queryset):
+    # What the records endpoint did before: one model instance per row
+    return [{
+        "id": record.id,
+        "patient_id": record.patient_id,
+        "date": record.date.isoformat(),
+        "weight": record.weight,
+        "bp": DailyRecord.bp_display(record.bp, record.bp_systolic, record.bp_diastolic),
+        "notes": record.notes
+    } for record in queryset]
+
+
+def legacy_medicines(queryset):
+    data = []
+    for med in queryset:
+        timing_display = med.timing.capitalize() if med.timing else "Any time"
+        if med.food_relation:
+            food_text = "Before Food" if med.food_relation == "before_food" else "After Food"
+            timing_display += f" • {food_text}"
+        data.append({
+            "id": med.id,
+            "name": med.name,
+            "dose": med.dose,
+            "timing": med.timing,
+            "timing_display": timing_display,
+            "type": med.type,
+            "food_relation": med.food_relation,
+            "is_given_today": med.given_today
+        })
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Compares CPU time of model-instance serialization against the projection serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=200)
+        parser.add_argument('--days', type=int, default=60, help='Daily records per patient')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        records_serializer = DailyRecordSerializer()
+        medicines_serializer = MedicationSerializer(
+            'id', 'name', 'dose', 'timing', 'timing_display', 'type', 'food_relation', 'is_given_today'
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp, scratch_database(tmp, 'serializers'):
+            patient_ids = seed_patients(options['patients'], meds_per_patient=4)
+            today = date.today()
+            DailyRecord.objects.bulk_create([
+                DailyRecord(patient_id=patient_id, date=today - timedelta(days=d),
+                            weight=60.0 + d % 7, bp_systolic=110 + d % 30, bp_diastolic=70 + d % 20)
+                for patient_id in patient_ids for d in range(options['days'])
+            ], batch_size=1000)
+
+            records = DailyRecord.objects.order_by('patient_id', '-date')
+            medicines = Medication.objects.with_given_on(today).order_by('id')
+            cases = {
+                # .all() so every run queries afresh instead of reusing a result cache
+                'records': (lambda: legacy_records(records.all()),
+                            lambda: records_serializer.serialize(records.all())),
+                'medicines': (lambda: legacy_medicines(medicines.all()),
+                              lambda: medicines_serializer.serialize(medicines.all())),
+            }
+            for name, (legacy, projection) in cases.items():
+                assert legacy() == projection(), f"{name}: outputs differ"
+                bp_display.cache_clear()
+                isoformat.cache_clear()
+                results[name] = {
+                    'rows': len(legacy()),
+                    'legacy_cpu_ms': self.cpu_ms(legacy, options['repeat']),
+                    'projection_cpu_ms': self.cpu_ms(projection, options['repeat']),
+                }
+                results[name]['speedup'] = round(
+                    results[name]['legacy_cpu_ms'] / results[name]['projection_cpu_ms'], 2
+                )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'resource':<10} {'rows':>7} {'legacy ms':>10} {'projection ms':>14} {'speedup':>8}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<10} {stats['rows']:>7} {stats['legacy_cpu_ms']:>10} "
+                f"{stats['projection_cpu_ms']:>14} {stats['speedup']:>7}x"
+            )
+
+    def cpu_ms(self, fn, repeat):
+        # Best of `repeat` runs of process CPU time, query execution included
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            fn()
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return round(best * 1000, 2)
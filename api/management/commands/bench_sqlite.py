@@ -0,0 +1,65 @@
+import json
+import random
+import tempfile
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from api.management.bench import run_clients, scratch_database, seed_patients
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks mixed daily_record writes and dashboard reads under the stock and tuned SQLite profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent dashboard readers')
+        parser.add_argument('--writers', type=int, default=4, help='Concurrent daily_record writers')
+        parser.add_argument('--patients', type=int, default=300)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        db = connections['default']
+        if db.vendor != 'sqlite':
+            self.stderr.write("bench_sqlite only applies to the SQLite backend")
+            return
+
+        profiles = [
+            ('stock', {}, 0),
+            ('tuned', settings.DATABASES['default'].get('OPTIONS', {}), settings.DATABASES['default'].get('CONN_MAX_AGE', 0)),
+        ]
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp, override_settings(DASHBOARD_CACHE_TIMEOUT=0):
+            for label, db_options, max_age in profiles:
+                # Each profile gets a fresh scratch database; db.sqlite3 is never touched
+                with scratch_database(tmp, label, OPTIONS=dict(db_options), CONN_MAX_AGE=max_age):
+                    patient_ids = seed_patients(options['patients'])
+                    results[label] = self.run_profile(patient_ids, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'profile':<8} {'op':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for label, ops in results.items():
+            for op, stats in ops.items():
+                self.stdout.write(
+                    f"{label:<8} {op:<10} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}"
+                )
+
+    def run_profile(self, patient_ids, options):
+        today = date.today()
+
+        def write(client):
+            return client.post('/api/daily/record', json.dumps({
+                'patient_id': random.choice(patient_ids),
+                'date': (today - timedelta(days=random.randrange(365))).isoformat(),
+                'weight': round(random.uniform(50, 90), 1),
+                'bp': f"{random.randint(110, 160)}/{random.randint(70, 100)}",
+            }), content_type='application/json')
+
+        def read(client):
+            return client.get('/api/dashboard')
+
+        workers = [('write', write)] * options['writers'] + [('dashboard', read)] * options['readers']
+        return run_clients(workers, options['duration'])
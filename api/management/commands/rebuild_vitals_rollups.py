@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from api.facilities import current_database, facilities, using_facility
+from api.models import Patient, DailyRecord, VitalsRollup
+
+
+class Command(BaseCommand):
+    help = 'Backfills or rebuilds the weekly/monthly vitals rollups from daily records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help='Limit to these patient ids (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Patients rebuilt per transaction')
+        parser.add_argument('--facility', action='append', help='Only these facilities (default: all)')
+
+    def handle(self, *args, **options):
+        selected = options['facility'] or facilities()
+        unknown = set(selected) - set(facilities())
+        if unknown:
+            raise CommandError(f"Unknown facilities: {', '.join(sorted(unknown))}")
+        for facility in selected:
+            with using_facility(facility):
+                self.rebuild(facility, options)
+
+    def rebuild(self, facility, options):
+        patients = Patient.objects.order_by('id').values_list('id', flat=True)
+        if options['patient']:
+            patients = patients.filter(id__in=options['patient'])
+        patient_ids = list(patients)
+
+        rebuilt = 0
+        batch_size = options['batch_size']
+        for i in range(0, len(patient_ids), batch_size):
+            batch = patient_ids[i:i + batch_size]
+            with transaction.atomic(using=current_database()):
+                # Drop everything first so buckets without records disappear too
+                VitalsRollup.objects.filter(patient_id__in=batch).delete()
+                span = DailyRecord.objects.filter(patient_id__in=batch).aggregate(first=Min('date'), last=Max('date'))
+                if span['first']:
+                    VitalsRollup.refresh(batch, [span['first'], span['last']])
+                # Trends responses carry the patient version in their ETag
+                Patient.objects.filter(id__in=batch).update(version=F('version') + 1, last_modified=timezone.now())
+            rebuilt += len(batch)
+            self.stdout.write(f"   {rebuilt}/{len(patient_ids)} patients")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {facility}: rebuilt {VitalsRollup.objects.count()} rollup buckets for {len(patient_ids)} patients"
+        ))
@@ -1,108 +1,264 @@
-from django.core.management.base import BaseCommand
-from api.models import Patient, Medication, DailyRecord
-from datetime import date, timedelta
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from api.facilities import current_database, facilities, using_facility
+from api.models import Patient, Medication, MedicationAdministration, DailyRecord, SyncTombstone, VitalsRollup
+from api.schedule import ANY_TIME, TIMING_SLOTS
+from datetime import date, datetime, time, timedelta
 import random
 
+# Sample Indian patient names
+FIRST_NAMES = [
+    "Ramesh", "Sita", "Govind", "Lakshmi", "Mohan", "Radha", "Shankar", "Kamal",
+    "Baldev", "Geeta", "Arjun", "Sunita", "Vijay", "Savitri", "Prakash", "Usha"
+]
+LAST_NAMES = [
+    "Kumar", "Devi", "Singh", "Bai", "Lal", "Rani", "Das", "Joshi",
+    "Patel", "Sharma", "Nair", "Iyer", "Reddy", "Gupta", "Verma", "Mehta"
+]
+
+GENDERS = ["Male", "Female"]
+CHIEF_COMPLAINTS = [
+    "Hypertension, Diabetes", "Joint pain, Arthritis",
+    "Chronic cough, Weakness", "Gastric issues, Constipation",
+    "Insomnia, Memory issues", "Breathing difficulty",
+    "Diabetes, High BP", "Knee pain, Back pain"
+]
+
+# Sample medications (Ayurvedic + Allopathic)
+MEDICATIONS = [
+    ("Ashwagandha Tablet", "1 tab", "morning"),
+    ("Giloy Juice", "15ml", "morning"),
+    ("Amla Juice", "20ml", "morning"),
+    ("Triphala Churna", "1 tsp", "night"),
+    ("Tulsi Tablet", "1 tab", "morning"),
+    ("Amlapitta Syrup", "10ml", "after_food"),
+    ("Mahasudarshan Churna", "1 tsp", "before_food"),
+    ("Panchsakar Churna", "1 tsp", "night"),
+    ("Arogyavardhini Vati", "1 tab", "after_food"),
+    ("Laksmivilas Ras", "1 tab", "morning"),
+    ("Metformin 500mg", "1 tab", "after_food"),
+    ("Amlodipine 5mg", "1 tab", "morning"),
+    ("Losartan 50mg", "1 tab", "morning"),
+    ("Atorvastatin 10mg", "1 tab", "night")
+]
+FOOD_RELATIONS = ["before_food", "after_food", None]
+
+NOTES = [
+    "Patient active, ate well",
+    "Slight headache, BP controlled",
+    "Good appetite, slept well",
+    "Joint pain mild, walking with support",
+    "Feeling better today",
+    "Constipation, advised more water"
+]
+
+DAILY_RECORD_COLUMNS = ['patient_id', 'date', 'weight', 'bp_systolic', 'bp_diastolic', 'bp', 'notes']
+ADMINISTRATION_COLUMNS = ['medication_id', 'patient_id', 'date', 'given_at']
+
+# Every table a seed rewrites, children first
+SEEDED_MODELS = [VitalsRollup, MedicationAdministration, DailyRecord, Medication, Patient, SyncTombstone]
+# Tables stamped with change_seq by the sync triggers (migration 0008)
+SYNCED_MODELS = [Patient, Medication, DailyRecord, MedicationAdministration]
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Chance of a daily record on any given day, for patients that have them
+RECORD_PROBABILITY = 0.7
+
+
 class Command(BaseCommand):
-    help = 'Seeds the database with dummy data'
+    help = 'Seeds the database with dummy data (deterministic for a given --seed)'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=12)
+        parser.add_argument('--days', type=int, default=7, help='Days of daily record history, ending today')
+        parser.add_argument('--meds-per-patient', type=int, default=None,
+                            help='Medications per patient (default: 2 to 4 at random)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed; same seed, same data')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Patients written per transaction')
+        parser.add_argument('--facility', help='Facility to seed (default: the default facility)')
+        parser.add_argument('--dose-rate', type=float, default=0.9,
+                            help='Share of past scheduled doses logged as given, 0 to 1 (today starts pending)')
+
+    def handle(self, *args, **options):
+        facility = options['facility'] or facilities()[0]
+        if facility not in facilities():
+            raise CommandError(f"Unknown facility: {facility}")
+        if not 0 <= options['dose_rate'] <= 1:
+            raise CommandError("--dose-rate must be between 0 and 1")
+        with using_facility(facility):
+            self.seed(options)
+
+    def seed(self, options):
         self.stdout.write("🌱 Seeding dummy data...")
+        rng = random.Random(options['seed'])
+        connection = connections[current_database()]
+
+        today = date.today()
+        days = [today - timedelta(days=x) for x in range(options['days'])]
+        first_day = days[-1] if days else today
+        totals = {'patients': 0, 'medications': 0, 'records': 0, 'doses': 0}
+
+        with self.triggers_and_indexes_dropped(connection):
+            self.truncate(connection)
+            for start in range(0, options['patients'], options['batch_size']):
+                count = min(options['batch_size'], options['patients'] - start)
+                with transaction.atomic(using=connection.alias):
+                    patients = Patient.objects.bulk_create([
+                        Patient(
+                            name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                            age=rng.randint(65, 92),
+                            gender=rng.choice(GENDERS),
+                            chief_complaint=rng.choice(CHIEF_COMPLAINTS),
+                            date_of_joining=first_day
+                        )
+                        for _ in range(count)
+                    ])
+                    medications = Medication.objects.bulk_create(
+                        self.medications(rng, patients, options['meds_per_patient'])
+                    )
+                    # About a third of patients never get records, as in the small seed
+                    record_patients = [patient for i, patient in enumerate(patients, start) if i % 3 != 2]
+                    records = self.insert_rows(DailyRecord, DAILY_RECORD_COLUMNS,
+                                               self.daily_records(rng, record_patients, days))
+                    if records:
+                        VitalsRollup.refresh([patient.id for patient in record_patients], [first_day, today])
+                    doses = self.insert_rows(MedicationAdministration, ADMINISTRATION_COLUMNS,
+                                             self.administrations(rng, medications, days[1:], options['dose_rate']))
+
+                totals['patients'] += len(patients)
+                totals['medications'] += len(medications)
+                totals['records'] += records
+                totals['doses'] += doses
+                if options['patients'] > options['batch_size']:
+                    self.stdout.write(f"   {totals['patients']}/{options['patients']} patients")
+            self.rebuild_trigger_state(connection)
 
-        # Clear existing data
-        DailyRecord.objects.all().delete()
-        Medication.objects.all().delete()
-        Patient.objects.all().delete()
-
-        # Sample Indian patient names
-        patient_names = [
-            "Ramesh Kumar", "Sita Devi", "Govind Singh", "Lakshmi Bai", 
-            "Mohan Lal", "Radha Rani", "Shankar Das", "Kamal Devi",
-            "Baldev Singh", "Geeta Joshi", "Arjun Patel", "Sunita Sharma"
-        ]
-        
-        genders = ["Male", "Female"]
-        chief_complaints = [
-            "Hypertension, Diabetes", "Joint pain, Arthritis", 
-            "Chronic cough, Weakness", "Gastric issues, Constipation",
-            "Insomnia, Memory issues", "Breathing difficulty",
-            "Diabetes, High BP", "Knee pain, Back pain"
-        ]
-        
-        # Sample medications (Ayurvedic + Allopathic)
-        medications_list = [
-            ("Ashwagandha Tablet", "1 tab", "morning"),
-            ("Giloy Juice", "15ml", "morning"),
-            ("Amla Juice", "20ml", "morning"),
-            ("Triphala Churna", "1 tsp", "night"),
-            ("Tulsi Tablet", "1 tab", "morning"),
-            ("Amlapitta Syrup", "10ml", "after_food"),
-            ("Mahasudarshan Churna", "1 tsp", "before_food"),
-            ("Panchsakar Churna", "1 tsp", "night"),
-            ("Arogyavardhini Vati", "1 tab", "after_food"),
-            ("Laksmivilas Ras", "1 tab", "morning"),
-            ("Metformin 500mg", "1 tab", "after_food"),
-            ("Amlodipine 5mg", "1 tab", "morning"),
-            ("Losartan 50mg", "1 tab", "morning"),
-            ("Atorvastatin 10mg", "1 tab", "night")
-        ]
-        
-        # Create 12 patients
-        patients = []
-        for i in range(12):
-            patient = Patient.objects.create(
-                name=patient_names[i],
-                age=random.randint(65, 92),
-                gender=random.choice(genders),
-                chief_complaint=random.choice(chief_complaints)
+        # Print summary
+        self.stdout.write(self.style.SUCCESS(f"✅ Seeding completed!"))
+        self.stdout.write(f"   📊 {totals['patients']} patients added")
+        self.stdout.write(f"   💊 {totals['medications']} medications added")
+        self.stdout.write(f"   📋 {totals['records']} daily records added")
+        self.stdout.write(f"   ✔️ {totals['doses']} doses logged")
+
+    @contextmanager
+    def triggers_and_indexes_dropped(self, connection):
+        """
+        Drop the seeded tables' triggers (patient versions, search index,
+        sync stamps and tombstones) and secondary indexes for the block, and
+        recreate them from their stored SQL afterwards, even if the seed
+        fails. Triggers fire per row, and an index built once over the
+        loaded rows is cheaper than one kept up per insert. Don't seed a
+        database a running server is writing to.
+        """
+        tables = [model._meta.db_table for model in SEEDED_MODELS]
+        with connection.cursor() as cursor:
+            # Constraint-backed indexes have no SQL and stay
+            cursor.execute(
+                f"SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'index') "
+                f"AND sql IS NOT NULL AND tbl_name IN ({', '.join(['%s'] * len(tables))})", tables
             )
-            patients.append(patient)
-        
-        # Add medications to each patient (2-4 meds each)
+            schema = cursor.fetchall()
+            for kind, name, _ in schema:
+                cursor.execute(f"DROP {kind.upper()} {connection.ops.quote_name(name)}")
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                for _, _, sql in schema:
+                    cursor.execute(sql)
+
+    def truncate(self, connection):
+        # Without triggers a bare DELETE is SQLite's truncate: no per-row
+        # tombstones or version bumps. Tombstones go too, so tablets must
+        # sync from scratch after a reseed.
+        qn = connection.ops.quote_name
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for model in SEEDED_MODELS:
+                cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+
+    def rebuild_trigger_state(self, connection):
+        """What the dropped triggers would have written, a statement per table."""
+        qn = connection.ops.quote_name
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("INSERT INTO patient_fts(patient_fts) VALUES ('rebuild')")
+            # New ids, so one bump is enough to keep ETags from matching old bodies
+            cursor.execute(f"UPDATE {qn(Patient._meta.db_table)} SET version = version + 1, last_modified = {NOW}")
+            # Distinct sequence numbers above every earlier one, table after table
+            for model in SYNCED_MODELS:
+                table = qn(model._meta.db_table)
+                cursor.execute(
+                    f"UPDATE {table} SET change_seq = id + (SELECT value FROM sync_sequence), updated_at = {NOW}"
+                )
+                cursor.execute(
+                    f"UPDATE sync_sequence SET value = value + COALESCE((SELECT MAX(id) FROM {table}), 0)"
+                )
+
+    def medications(self, rng, patients, per_patient):
         for patient in patients:
-            num_meds = random.randint(2, 4)
-            for _ in range(num_meds):
-                med_name, dose, timing = random.choice(medications_list)
-                Medication.objects.create(
+            for _ in range(per_patient if per_patient is not None else rng.randint(2, 4)):
+                med_name, dose, timing = rng.choice(MEDICATIONS)
+                yield Medication(
                     patient=patient,
                     name=med_name,
                     type="count" if "tab" in dose.lower() or "tsp" in dose.lower() else "ml",
                     dose=dose,
                     timing=timing,
-                    food_relation=random.choice(["before_food", "after_food", None])
+                    food_relation=rng.choice(FOOD_RELATIONS)
                 )
-        
-        # Add daily records for last 7 days for some patients
-        recent_dates = [date.today() - timedelta(days=x) for x in range(7)]
-        
-        for patient in patients[:8]:  # First 8 patients
-            for date_obj in recent_dates:
-                if random.random() > 0.3:  # 70% chance of having record
-                    bp_systolic = random.randint(110, 160)
-                    bp_diastolic = random.randint(70, 100)
-                    DailyRecord.objects.create(
-                        patient=patient,
-                        date=date_obj,
-                        weight=round(random.uniform(55, 85), 1),
-                        bp_systolic=bp_systolic,
-                        bp_diastolic=bp_diastolic,
-                        bp=f"{bp_systolic}/{bp_diastolic}",
-                        notes=random.choice([
-                            "Patient active, ate well",
-                            "Slight headache, BP controlled",
-                            "Good appetite, slept well",
-                            "Joint pain mild, walking with support",
-                            "Feeling better today",
-                            "Constipation, advised more water"
-                        ])
-                    )
-        
-        # Print summary
-        total_patients = Patient.objects.count()
-        total_meds = Medication.objects.count()
-        total_records = DailyRecord.objects.count()
-        
-        self.stdout.write(self.style.SUCCESS(f"✅ Seeding completed!"))
-        self.stdout.write(f"   📊 {total_patients} patients added")
-        self.stdout.write(f"   💊 {total_meds} medications added") 
-        self.stdout.write(f"   📋 {total_records} daily records added")
+
+    def daily_records(self, rng, patients, days):
+        """Row tuples in DAILY_RECORD_COLUMNS order."""
+        days = [connections[current_database()].ops.adapt_datefield_value(day) for day in days]
+        for patient in patients:
+            for day in days:
+                if rng.random() >= RECORD_PROBABILITY:
+                    continue
+                bp_systolic = rng.randint(110, 160)
+                bp_diastolic = rng.randint(70, 100)
+                yield (
+                    patient.id, day, round(rng.uniform(55, 85), 1),
+                    bp_systolic, bp_diastolic, f"{bp_systolic}/{bp_diastolic}", rng.choice(NOTES)
+                )
+
+    def administrations(self, rng, medications, days, dose_rate):
+        """
+        Row tuples in ADMINISTRATION_COLUMNS order: each dose given at its
+        slot with `dose_rate` chance. Medication by medication, oldest day
+        first: rows arrive in the order of the log's unique (medication,
+        date) index, so inserts append to it instead of splitting pages.
+        """
+        ops = connections[current_database()].ops
+        slots = {timing: time.fromisoformat(slot) for timing, slot in TIMING_SLOTS.items()}
+        any_time = time.fromisoformat(ANY_TIME)
+        days = sorted(days)
+        stored_days = [ops.adapt_datefield_value(day) for day in days]
+        # A handful of distinct timestamps per day; convert each once, not per dose
+        given_at = {
+            timing: [
+                ops.adapt_datetimefield_value(timezone.make_aware(datetime.combine(day, slots.get(timing) or any_time)))
+                for day in days
+            ]
+            for timing in {med.timing for med in medications}
+        }
+        for med in medications:
+            stamps = given_at[med.timing]
+            for i, stored_day in enumerate(stored_days):
+                if rng.random() < dose_rate:
+                    yield med.id, med.patient_id, stored_day, stamps[i]
+
+    def insert_rows(self, model, column_names, rows):
+        # Daily history and the dose log are two orders of magnitude larger
+        # than everything else; building and compiling a model instance per
+        # row would dominate the run, so these go straight to executemany
+        connection = connections[current_database()]
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(column) for column in column_names)
+        placeholders = ', '.join(['%s'] * len(column_names))
+        rows = list(rows)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {qn(model._meta.db_table)} ({columns}) VALUES ({placeholders})", rows
+            )
+        return len(rows)
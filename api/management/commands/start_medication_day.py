@@ -0,0 +1,38 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from api.facilities import facilities, using_facility
+from api.models import Medication
+
+
+class Command(BaseCommand):
+    help = (
+        "Resets the legacy is_given_today flags for a new day, archiving the previous "
+        "days' doses into the administration log. Idempotent; safe to run from cron "
+        "just after midnight, e.g. `5 0 * * * manage.py start_medication_day`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day being started, YYYY-MM-DD (default: today)')
+        parser.add_argument('--facility', action='append', help='Only these facilities (default: all)')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+
+        selected = options['facility'] or facilities()
+        unknown = set(selected) - set(facilities())
+        if unknown:
+            raise CommandError(f"Unknown facilities: {', '.join(sorted(unknown))}")
+
+        for facility in selected:
+            started = time.perf_counter()
+            with using_facility(facility):
+                archived, reset = Medication.start_day(day)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {facility} {day}: reset {reset} medication flags, "
+                f"archived {archived} unlogged doses ({elapsed:.0f} ms)"
+            ))
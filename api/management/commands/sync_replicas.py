@@ -0,0 +1,31 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from api.facilities import refresh_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies each database in REPLICA_DATABASES onto its read replica with the SQLite '
+        'backup API, once or every --interval seconds'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds (default: once)')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError("No replicas configured; set READ_REPLICAS=1 or REPLICA_DATABASES")
+
+        while True:
+            for primary, replica in settings.REPLICA_DATABASES.items():
+                started = time.perf_counter()
+                refresh_replica(primary)
+                elapsed = (time.perf_counter() - started) * 1000
+                self.stdout.write(f"   {primary} -> {replica} ({elapsed:.0f} ms)")
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS("✅ Replicas refreshed"))
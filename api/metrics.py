@@ -0,0 +1,185 @@
+"""
+Per-request performance counters and rolling latency percentiles per URL
+name, fed by api.middleware.RequestMetricsMiddleware.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from django import http
+
+# Samples kept per URL name for the percentiles
+METRICS_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class RequestMetrics:
+    """Counters for one request; shared by every context the request spawns."""
+    __slots__ = ('queries', 'db_time', 'json_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.json_time = 0.0
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper that charges each query to the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    # Connections are per thread (and per sync_to_async thread under ASGI),
+    # so the wrapper is attached to each one as it is created
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class JsonResponse(http.JsonResponse):
+    """JsonResponse that charges its encoding time to the current request."""
+    def __init__(self, *args, **kwargs):
+        started = time.perf_counter()
+        super().__init__(*args, **kwargs)
+        if (metrics := _current.get()) is not None:
+            metrics.json_time += time.perf_counter() - started
+
+
+class LatencyRegistry:
+    """Rolling window of request timings per URL name, plus running totals."""
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, name, duration, metrics):
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = {
+                    'samples': deque(maxlen=self.window),
+                    'count': 0, 'sum': 0.0, 'db_sum': 0.0, 'queries': 0,
+                }
+            series['samples'].append(duration)
+            series['count'] += 1
+            series['sum'] += duration
+            series['db_sum'] += metrics.db_time
+            series['queries'] += metrics.queries
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {**series, 'samples': list(series['samples'])}
+                for name, series in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Prometheus text exposition of the current window."""
+        series = sorted(self.snapshot().items())
+        lines = [
+            '# HELP api_request_duration_seconds Request duration by URL name (rolling window quantiles).',
+            '# TYPE api_request_duration_seconds summary',
+        ]
+        for name, data in series:
+            for quantile in QUANTILES:
+                value = percentile(data['samples'], quantile * 100)
+                lines.append(f'api_request_duration_seconds{{view="{name}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'api_request_duration_seconds_sum{{view="{name}"}} {data["sum"]:.6f}')
+            lines.append(f'api_request_duration_seconds_count{{view="{name}"}} {data["count"]}')
+        lines += [
+            '# HELP api_request_db_seconds_total Time spent executing SQL by URL name.',
+            '# TYPE api_request_db_seconds_total counter',
+        ]
+        lines += [f'api_request_db_seconds_total{{view="{name}"}} {data["db_sum"]:.6f}' for name, data in series]
+        lines += [
+            '# HELP api_request_queries_total SQL queries executed by URL name.',
+            '# TYPE api_request_queries_total counter',
+        ]
+        lines += [f'api_request_queries_total{{view="{name}"}} {data["queries"]}' for name, data in series]
+        return '\n'.join(lines) + '\n'
+
+
+class CacheStats:
+    """Hit and miss counters per cache name, for tuning cache sizes."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, name, hit):
+        with self._lock:
+            counts = self._counts.setdefault(name, {'hit': 0, 'miss': 0})
+            counts['hit' if hit else 'miss'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def render(self):
+        lines = [
+            '# HELP api_cache_requests_total Cache lookups by cache name and result.',
+            '# TYPE api_cache_requests_total counter',
+        ]
+        for name, counts in sorted(self.snapshot().items()):
+            for result, count in counts.items():
+                lines.append(f'api_cache_requests_total{{cache="{name}",result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields as top-level keys."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+registry = LatencyRegistry()
+cache_stats = CacheStats()
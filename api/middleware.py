@@ -0,0 +1,144 @@
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from .facilities import (
+    FACILITY_HEADER, release_facility, requires_selection, select_facility
+)
+from .metrics import JsonResponse, end_request, install_query_timer, registry, start_request
+
+logger = logging.getLogger('api.metrics')
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request and break it down into SQL, JSON encoding and the rest
+    of the view. Reported as a Server-Timing header and a log line, and fed
+    into the per-URL-name percentiles served at /api/_metrics.
+
+    Streaming responses are timed up to the point the response is returned,
+    not until their body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Connections opened before the app was ready never saw connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        metrics, token = start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics, token = start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    def report(self, request, response, metrics, duration):
+        match = request.resolver_match
+        name = match.url_name if match and match.url_name else 'unmatched'
+        registry.observe(name, duration, metrics)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f'json;dur={metrics.json_time * 1000:.2f}',
+            f'view;dur={duration * 1000:.2f}',
+        ])
+        logger.info(
+            'request view=%s method=%s status=%s duration_ms=%.2f db_ms=%.2f queries=%d json_ms=%.2f',
+            name, request.method, response.status_code, duration * 1000,
+            metrics.db_time * 1000, metrics.queries, metrics.json_time * 1000,
+            extra={
+                'view': name,
+                'method': request.method,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'queries': metrics.queries,
+                'json_ms': round(metrics.json_time * 1000, 2),
+            }
+        )
+        return response
+
+
+class FacilityMiddleware:
+    """
+    Select the facility named by the X-Facility header (or ?facility=) for
+    the rest of the request, so api queries go to that facility's database.
+    Without one, the dashboard and reports cover every facility; other api
+    views are rejected when more than one facility is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        try:
+            token = self.begin(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.end(token)
+        return self.finish(response)
+
+    async def __acall__(self, request):
+        try:
+            token = self.begin(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.end(token)
+        return self.finish(response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if requires_selection(view_func):
+            return JsonResponse(
+                {"error": f"Several facilities are configured; name one with the {FACILITY_HEADER} header"},
+                status=400
+            )
+        return None
+
+    @staticmethod
+    def begin(request):
+        facility = request.headers.get(FACILITY_HEADER) or request.GET.get('facility')
+        return select_facility(facility) if facility else None
+
+    @staticmethod
+    def end(token):
+        if token is not None:
+            release_facility(token)
+
+    @staticmethod
+    def finish(response):
+        # The same URL serves different facilities
+        patch_vary_headers(response, [FACILITY_HEADER])
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:50
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_administrations(apps, schema_editor):
+    # Carry over the doses already flagged as given into the new log
+    Medication = apps.get_model('api', 'Medication')
+    MedicationAdministration = apps.get_model('api', 'MedicationAdministration')
+    given = Medication.objects.filter(is_given_today=True, given_at__isnull=False)
+    MedicationAdministration.objects.bulk_create([
+        MedicationAdministration(
+            medication_id=med.id,
+            patient_id=med.patient_id,
+            date=med.given_at.date(),
+            given_at=med.given_at,
+        )
+        for med in given.iterator()
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicationAdministration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=datetime.date.today)),
+                ('given_at', models.DateTimeField()),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='administrations', to='api.medication')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='administrations', to='api.patient')),
+            ],
+            options={
+                'db_table': 'medication_administration',
+                'indexes': [models.Index(fields=['patient', 'date'], name='med_admin_patient_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medication', 'date'), name='unique_medication_date')],
+            },
+        ),
+        migrations.RunPython(backfill_administrations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_medicationadministration'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='medicationadministration',
+            name='med_admin_patient_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dailyrecord',
+            index=models.Index(fields=['date', 'patient'], name='daily_record_date_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['patient', 'timing'], name='medication_patient_timing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicationadministration',
+            index=models.Index(fields=['patient', 'date', 'medication'], name='med_admin_patient_date_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# SQLite triggers: every write touching a patient's data bumps its version,
+# whichever code path made it (ORM saves, bulk upserts, raw SQL, admin).
+BUMP = (
+    "UPDATE patient SET version = version + 1, "
+    "last_modified = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id IN ({ids});"
+)
+
+CHILD_TABLES = ['daily_record', 'medication', 'medication_administration']
+
+
+def trigger_sql():
+    statements = []
+    for table in CHILD_TABLES:
+        for event, ids in (
+            ('INSERT', 'NEW.patient_id'),
+            ('UPDATE', 'OLD.patient_id, NEW.patient_id'),
+            ('DELETE', 'OLD.patient_id'),
+        ):
+            statements.append(
+                f"CREATE TRIGGER {table}_{event.lower()}_bump_patient_version "
+                f"AFTER {event} ON {table} BEGIN {BUMP.format(ids=ids)} END;"
+            )
+    # Own-field edits; the trigger's own UPDATE does not re-fire it
+    # because recursive_triggers is off
+    statements.append(
+        "CREATE TRIGGER patient_update_bump_version "
+        "AFTER UPDATE OF name, age, gender, chief_complaint, date_of_joining ON patient "
+        f"BEGIN {BUMP.format(ids='NEW.id')} END;"
+    )
+    return statements
+
+
+def drop_trigger_sql():
+    names = [
+        f"{table}_{event}_bump_patient_version"
+        for table in CHILD_TABLES for event in ('insert', 'update', 'delete')
+    ]
+    return [f"DROP TRIGGER IF EXISTS {name};" for name in names + ['patient_update_bump_version']]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='last_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(trigger_sql(), drop_trigger_sql()),
+    ]
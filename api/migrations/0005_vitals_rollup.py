@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_patient_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(max_length=10)),
+                ('period_start', models.DateField()),
+                ('record_count', models.IntegerField(default=0)),
+                ('systolic_min', models.IntegerField(blank=True, null=True)),
+                ('systolic_max', models.IntegerField(blank=True, null=True)),
+                ('systolic_mean', models.FloatField(blank=True, null=True)),
+                ('systolic_count', models.IntegerField(default=0)),
+                ('diastolic_min', models.IntegerField(blank=True, null=True)),
+                ('diastolic_max', models.IntegerField(blank=True, null=True)),
+                ('diastolic_mean', models.FloatField(blank=True, null=True)),
+                ('diastolic_count', models.IntegerField(default=0)),
+                ('weight_min', models.FloatField(blank=True, null=True)),
+                ('weight_max', models.FloatField(blank=True, null=True)),
+                ('weight_mean', models.FloatField(blank=True, null=True)),
+                ('weight_count', models.IntegerField(default=0)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vitals_rollups', to='api.patient')),
+            ],
+            options={
+                'db_table': 'vitals_rollup',
+                'constraints': [models.UniqueConstraint(fields=('patient', 'granularity', 'period_start'), name='unique_vitals_rollup_period')],
+            },
+        ),
+    ]
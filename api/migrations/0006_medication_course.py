@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_vitals_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='duration_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='start_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:30
+
+from django.db import migrations
+
+# External-content FTS5 index over patient name and chief complaint: the
+# text lives only in the patient table, the index holds just the tokens.
+# prefix='2 3' adds prefix indexes so short "ram*" style queries don't
+# have to walk every term.
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE patient_fts USING fts5(
+    name, chief_complaint,
+    content='patient', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+"""
+
+# Kept in sync by triggers, so every write path (ORM, bulk_create, raw SQL,
+# admin) updates the index. The update trigger only watches the indexed
+# columns, so version bumps never touch it.
+TRIGGERS = [
+    """
+    CREATE TRIGGER patient_fts_insert AFTER INSERT ON patient BEGIN
+        INSERT INTO patient_fts(rowid, name, chief_complaint)
+        VALUES (NEW.id, NEW.name, NEW.chief_complaint);
+    END;
+    """,
+    """
+    CREATE TRIGGER patient_fts_delete AFTER DELETE ON patient BEGIN
+        INSERT INTO patient_fts(patient_fts, rowid, name, chief_complaint)
+        VALUES ('delete', OLD.id, OLD.name, OLD.chief_complaint);
+    END;
+    """,
+    """
+    CREATE TRIGGER patient_fts_update AFTER UPDATE OF name, chief_complaint ON patient BEGIN
+        INSERT INTO patient_fts(patient_fts, rowid, name, chief_complaint)
+        VALUES ('delete', OLD.id, OLD.name, OLD.chief_complaint);
+        INSERT INTO patient_fts(rowid, name, chief_complaint)
+        VALUES (NEW.id, NEW.name, NEW.chief_complaint);
+    END;
+    """,
+]
+
+# Index the patients that already exist
+REBUILD = "INSERT INTO patient_fts(patient_fts) VALUES ('rebuild');"
+
+DROP = [
+    "DROP TRIGGER IF EXISTS patient_fts_insert;",
+    "DROP TRIGGER IF EXISTS patient_fts_delete;",
+    "DROP TRIGGER IF EXISTS patient_fts_update;",
+    "DROP TABLE IF EXISTS patient_fts;",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_medication_course'),
+    ]
+
+    operations = [
+        migrations.RunSQL([CREATE_INDEX, *TRIGGERS, REBUILD], DROP),
+    ]
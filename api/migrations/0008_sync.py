@@ -0,0 +1,168 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:19
+
+from django.db import migrations, models
+
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Columns whose changes a tablet needs to see, per synced table
+SYNCED_TABLES = {
+    'patient': ['name', 'age', 'gender', 'chief_complaint', 'date_of_joining'],
+    # is_given_today/given_at are legacy mirrors of the administration log,
+    # which syncs on its own
+    'medication': [
+        'patient_id', 'name', 'type', 'dose', 'timing', 'food_relation', 'start_date', 'duration_days'
+    ],
+    'daily_record': ['patient_id', 'date', 'weight', 'bp_systolic', 'bp_diastolic', 'bp', 'notes'],
+    'medication_administration': ['medication_id', 'patient_id', 'date', 'given_at'],
+}
+
+# 0004's update triggers fired on any column; narrowed to the data columns
+# so the sync triggers' own change_seq stamps don't bump versions again
+BUMP = (
+    "UPDATE patient SET version = version + 1, "
+    f"last_modified = {NOW} WHERE id IN (OLD.patient_id, NEW.patient_id);"
+)
+CHILD_TABLES = ['daily_record', 'medication', 'medication_administration']
+
+
+def version_trigger_sql(narrow):
+    statements = []
+    for table in CHILD_TABLES:
+        name = f"{table}_update_bump_patient_version"
+        columns = f" OF {', '.join(SYNCED_TABLES[table])}" if narrow else ""
+        statements += [
+            f"DROP TRIGGER IF EXISTS {name};",
+            f"CREATE TRIGGER {name} AFTER UPDATE{columns} ON {table} BEGIN {BUMP} END;",
+        ]
+    return statements
+
+
+# One global, strictly increasing sequence across all synced tables. SQLite
+# serializes writers, so a row's change_seq orders it against every other
+# committed change.
+SEQUENCE = [
+    "CREATE TABLE sync_sequence (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL);",
+    "INSERT INTO sync_sequence (id, value) VALUES (1, 0);",
+]
+NEXT = "UPDATE sync_sequence SET value = value + 1;"
+CURRENT = "(SELECT value FROM sync_sequence)"
+
+
+def backfill_sql():
+    # Distinct sequence numbers for existing rows, so first syncs can page
+    statements = []
+    for table in SYNCED_TABLES:
+        statements += [
+            f"UPDATE {table} SET change_seq = id + {CURRENT}, updated_at = {NOW};",
+            f"UPDATE sync_sequence SET value = value + COALESCE((SELECT MAX(id) FROM {table}), 0);",
+        ]
+    return statements
+
+
+def sync_trigger_sql():
+    statements = []
+    for table, columns in SYNCED_TABLES.items():
+        stamp = f"{NEXT} UPDATE {table} SET change_seq = {CURRENT}, updated_at = {NOW} WHERE id = NEW.id;"
+        statements += [
+            f"CREATE TRIGGER {table}_insert_sync AFTER INSERT ON {table} BEGIN {stamp} END;",
+            f"CREATE TRIGGER {table}_update_sync AFTER UPDATE OF {', '.join(columns)} ON {table} "
+            f"BEGIN {stamp} END;",
+            f"CREATE TRIGGER {table}_delete_sync AFTER DELETE ON {table} BEGIN {NEXT} "
+            f"INSERT INTO sync_tombstone (\"table\", object_id, change_seq, deleted_at) "
+            f"VALUES ('{table}', OLD.id, {CURRENT}, {NOW}); END;",
+        ]
+    return statements
+
+
+def drop_sync_sql():
+    return [
+        f"DROP TRIGGER IF EXISTS {table}_{event}_sync;"
+        for table in SYNCED_TABLES for event in ('insert', 'update', 'delete')
+    ] + ["DROP TABLE IF EXISTS sync_sequence;"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_patient_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=40)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'sync_tombstone',
+            },
+        ),
+        migrations.AddField(
+            model_name='dailyrecord',
+            name='change_seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyrecord',
+            name='updated_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='change_seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='updated_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicationadministration',
+            name='change_seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicationadministration',
+            name='updated_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='change_seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrecord',
+            index=models.Index(fields=['change_seq'], name='daily_record_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['change_seq'], name='medication_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicationadministration',
+            index=models.Index(fields=['change_seq'], name='med_admin_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['change_seq'], name='patient_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['change_seq'], name='sync_tombstone_change_seq_idx'),
+        ),
+        migrations.RunSQL(
+            [*version_trigger_sql(narrow=True), *SEQUENCE, *backfill_sql(), *sync_trigger_sql()],
+            [*drop_sync_sql(), *version_trigger_sql(narrow=False)]
+        ),
+    ]
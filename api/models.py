@@ -1,5 +1,8 @@
-from django.db import models
-from datetime import date
+import re
+from django.db import connections, models, router, transaction
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from datetime import date, datetime, time, timedelta
 
 class Patient(models.Model):
     name = models.CharField(max_length=100)
@@ -7,17 +10,50 @@ class Patient(models.Model):
     gender = models.CharField(max_length=20)
     chief_complaint = models.TextField(null=True, blank=True)
     date_of_joining = models.DateField(default=date.today)
+    # Bumped by database triggers on any write to the patient or its
+    # records, medications or administrations; drives ETag/Last-Modified
+    version = models.PositiveIntegerField(default=0)
+    last_modified = models.DateTimeField(default=timezone.now)
+    # Stamped by database triggers on every insert/update (migration 0008);
+    # change_seq is the global sync sequence behind /api/sync cursors.
+    # Nullable so adding them doesn't make SQLite rebuild the table (and
+    # drop its triggers); the triggers fill them in on every write.
+    updated_at = models.DateTimeField(null=True, editable=False)
+    change_seq = models.BigIntegerField(null=True, editable=False)
 
     class Meta:
         db_table = 'patient'
+        indexes = [models.Index(fields=['change_seq'], name='patient_change_seq_idx')]
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "age": self.age,
-            "gender": self.gender,
-        }
+    # Search terms beyond this are ignored
+    SEARCH_MAX_TERMS = 8
+
+    @classmethod
+    def search(cls, query, limit):
+        """
+        Ids of the best `limit` patients matching every word of `query` as a
+        prefix of a word in their name or chief complaint, best first, from
+        the patient_fts index (migration 0007). Name matches rank higher.
+        """
+        terms = re.findall(r'\w+', query)[:cls.SEARCH_MAX_TERMS]
+        if not terms:
+            return []
+        # Quoted so user input can't inject FTS5 operators
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connections[router.db_for_read(cls)].cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM patient_fts WHERE patient_fts MATCH %s "
+                "ORDER BY bm25(patient_fts, 10.0, 1.0) LIMIT %s",
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+class MedicationQuerySet(models.QuerySet):
+    def with_given_on(self, day):
+        """Annotate `given_today` from the administration log for `day`."""
+        return self.annotate(given_today=models.Exists(
+            MedicationAdministration.objects.filter(medication=models.OuterRef('pk'), date=day)
+        ))
 
 class Medication(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medications')
@@ -28,9 +64,114 @@ class Medication(models.Model):
     food_relation = models.CharField(max_length=20, null=True, blank=True)
     is_given_today = models.BooleanField(default=False)
     given_at = models.DateTimeField(null=True, blank=True)
+    # Course window for the calendar; defaults to the patient's joining date
+    # and an open-ended course when unset
+    start_date = models.DateField(null=True, blank=True)
+    duration_days = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, editable=False)
+    change_seq = models.BigIntegerField(null=True, editable=False)
+
+    objects = MedicationQuerySet.as_manager()
+
+    @classmethod
+    def start_day(cls, day):
+        """
+        Clear the legacy is_given_today/given_at flags set before `day`, in
+        one transaction with copying any flagged dose the administration log
+        lacks into it under the date it was given. Flags set on `day` itself
+        are left alone, so a rerun (or a late run) is a no-op.
+        Returns (archived, reset) counts.
+        """
+        def midnight(day):
+            return timezone.make_aware(datetime.combine(day, time.min))
+
+        stale = cls.objects.filter(
+            models.Q(given_at__lt=midnight(day)) | models.Q(given_at__isnull=True), is_given_today=True
+        )
+        archived = 0
+        with transaction.atomic(using=router.db_for_write(cls)):
+            first = stale.aggregate(first=models.Min('given_at'))['first']
+            # A day at a time with a constant date; a per-row date cast is a
+            # Python function call on SQLite. Normally just the previous day.
+            logged_day = timezone.localdate(first) if first else day
+            while logged_day < day:
+                next_day = logged_day + timedelta(days=1)
+                archived += len(MedicationAdministration.log_doses(
+                    stale.filter(given_at__gte=midnight(logged_day), given_at__lt=midnight(next_day)).annotate(
+                        dose_date=models.Value(logged_day, output_field=models.DateField()),
+                        dose_given_at=models.F('given_at'),
+                    )
+                ))
+                logged_day = next_day
+            reset = stale.update(is_given_today=False, given_at=None)
+        return archived, reset
 
     class Meta:
         db_table = 'medication'
+        indexes = [
+            # Bulk marking by patient and timing
+            models.Index(fields=['patient', 'timing'], name='medication_patient_timing_idx'),
+            models.Index(fields=['change_seq'], name='medication_change_seq_idx'),
+        ]
+
+class MedicationAdministration(models.Model):
+    # Append-only log: one row per dose given, never updated in place
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='administrations')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='administrations')
+    date = models.DateField(default=date.today)
+    given_at = models.DateTimeField()
+    updated_at = models.DateTimeField(null=True, editable=False)
+    change_seq = models.BigIntegerField(null=True, editable=False)
+
+    class Meta:
+        db_table = 'medication_administration'
+        constraints = [
+            # Also serves as the (medication, date) index
+            models.UniqueConstraint(fields=['medication', 'date'], name='unique_medication_date')
+        ]
+        indexes = [
+            # Covers the reports adherence range scan, already in output order
+            models.Index(fields=['patient', 'date', 'medication'], name='med_admin_patient_date_idx'),
+            models.Index(fields=['change_seq'], name='med_admin_change_seq_idx'),
+        ]
+
+    @classmethod
+    def record_doses(cls, medications, day, given_at):
+        """
+        Log a dose for every medication in the `medications` queryset in one
+        INSERT ... SELECT ... ON CONFLICT DO NOTHING statement and return the
+        ids that were newly marked. Doses already logged for `day` are left
+        alone, so concurrent callers can never mark the same dose twice.
+        """
+        return cls.log_doses(medications.annotate(
+            dose_date=models.Value(day, output_field=models.DateField()),
+            dose_given_at=models.Value(given_at, output_field=models.DateTimeField()),
+        ))
+
+    @classmethod
+    def log_doses(cls, medications):
+        """
+        INSERT ... SELECT behind record_doses: one log row per medication in
+        a queryset annotated with `dose_date` and `dose_given_at`, skipping
+        doses already logged. Returns the newly logged medication ids.
+        """
+        rows = medications.order_by().values_list('id', 'patient_id', 'dose_date', 'dose_given_at')
+        select_sql, params = rows.query.sql_with_params()
+
+        connection = connections[router.db_for_write(cls)]
+        qn = connection.ops.quote_name
+        # SQLite needs the SELECT to carry a WHERE clause before ON CONFLICT
+        where = '' if ' WHERE ' in select_sql else ' WHERE 1 = 1'
+        sql = (
+            f"INSERT INTO {qn(cls._meta.db_table)} "
+            f"({qn('medication_id')}, {qn('patient_id')}, {qn('date')}, {qn('given_at')}) "
+            f"{select_sql}{where} "
+            f"ON CONFLICT ({qn('medication_id')}, {qn('date')}) DO NOTHING "
+            f"RETURNING {qn('medication_id')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {row[0] for row in cursor.fetchall()}
 
 class DailyRecord(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='daily_records')
@@ -43,21 +184,147 @@ class DailyRecord(models.Model):
     bp = models.CharField(max_length=20, null=True, blank=True)
     
     notes = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, editable=False)
+    change_seq = models.BigIntegerField(null=True, editable=False)
 
     class Meta:
         db_table = 'daily_record'
         constraints = [
             models.UniqueConstraint(fields=['patient', 'date'], name='unique_patient_date')
         ]
+        indexes = [
+            # Dashboard "recorded today" lookup and facility-wide date range scans
+            models.Index(fields=['date', 'patient'], name='daily_record_date_patient_idx'),
+            models.Index(fields=['change_seq'], name='daily_record_change_seq_idx'),
+        ]
+
+    @classmethod
+    def upsert(cls, patient_id, date, weight=None, bp=None, bp_systolic=None, bp_diastolic=None, notes=None):
+        """
+        Insert or update the (patient, date) record in a single statement
+        against unique_patient_date. A None weight keeps the stored weight.
+        """
+        connection = connections[router.db_for_write(cls)]
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        sql = f"""
+            INSERT INTO {table} ({qn('patient_id')}, {qn('date')}, {qn('weight')}, {qn('bp')},
+                                 {qn('bp_systolic')}, {qn('bp_diastolic')}, {qn('notes')})
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT ({qn('patient_id')}, {qn('date')}) DO UPDATE SET
+                {qn('weight')} = COALESCE(excluded.{qn('weight')}, {table}.{qn('weight')}),
+                {qn('bp')} = excluded.{qn('bp')},
+                {qn('bp_systolic')} = excluded.{qn('bp_systolic')},
+                {qn('bp_diastolic')} = excluded.{qn('bp_diastolic')},
+                {qn('notes')} = excluded.{qn('notes')}
+            RETURNING {qn('id')}, {qn('weight')}
+        """
+        params = [patient_id, connection.ops.adapt_datefield_value(date), weight, bp, bp_systolic, bp_diastolic, notes]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            record_id, stored_weight = cursor.fetchone()
+        return cls(
+            id=record_id, patient_id=patient_id, date=date,
+            weight=cls._meta.get_field('weight').to_python(stored_weight),
+            bp=bp, bp_systolic=bp_systolic, bp_diastolic=bp_diastolic, notes=notes
+        )
 
-    def to_dict(self):
+    @staticmethod
+    def bp_display(bp, bp_systolic, bp_diastolic):
         # Prefer combined bp if exists, else fallback to separate
-        bp_display = self.bp or (f"{self.bp_systolic}/{self.bp_diastolic}" if self.bp_systolic and self.bp_diastolic else None)
-        return {
-            "id": self.id,
-            "patient_id": self.patient_id,
-            "date": self.date.isoformat(),
-            "weight": self.weight,
-            "bp": bp_display,
-            "notes": self.notes
-        }
+        return bp or (f"{bp_systolic}/{bp_diastolic}" if bp_systolic and bp_diastolic else None)
+
+class VitalsRollup(models.Model):
+    """
+    Per-patient weekly/monthly vitals aggregates, recomputed bucket by bucket
+    whenever the underlying daily records change.
+    """
+    GRANULARITIES = ['week', 'month']
+    METRICS = {'systolic': 'bp_systolic', 'diastolic': 'bp_diastolic', 'weight': 'weight'}
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vitals_rollups')
+    granularity = models.CharField(max_length=10)
+    period_start = models.DateField()
+    record_count = models.IntegerField(default=0)
+
+    systolic_min = models.IntegerField(null=True, blank=True)
+    systolic_max = models.IntegerField(null=True, blank=True)
+    systolic_mean = models.FloatField(null=True, blank=True)
+    systolic_count = models.IntegerField(default=0)
+    diastolic_min = models.IntegerField(null=True, blank=True)
+    diastolic_max = models.IntegerField(null=True, blank=True)
+    diastolic_mean = models.FloatField(null=True, blank=True)
+    diastolic_count = models.IntegerField(default=0)
+    weight_min = models.FloatField(null=True, blank=True)
+    weight_max = models.FloatField(null=True, blank=True)
+    weight_mean = models.FloatField(null=True, blank=True)
+    weight_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'vitals_rollup'
+        constraints = [
+            # Also the index behind trends range reads
+            models.UniqueConstraint(fields=['patient', 'granularity', 'period_start'], name='unique_vitals_rollup_period')
+        ]
+
+    @staticmethod
+    def period_bounds(granularity, day):
+        """First day of the bucket containing `day`, and the first day of the next one."""
+        if granularity == 'week':
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7)
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+
+    @classmethod
+    def refresh(cls, patient_ids, days):
+        """
+        Recompute every week and month bucket touching `days` for the given
+        patients from DailyRecord. Only the affected buckets are read and
+        rewritten, so the cost is bounded by the bucket size, not history.
+        """
+        patient_ids, days = set(patient_ids), set(days)
+        if not patient_ids or not days:
+            return
+        connection = connections[router.db_for_write(cls)]
+        with transaction.atomic(using=connection.alias):
+            for granularity, trunc in zip(cls.GRANULARITIES, (TruncWeek, TruncMonth)):
+                start = cls.period_bounds(granularity, min(days))[0]
+                end = cls.period_bounds(granularity, max(days))[1]
+                aggregates = {'record_count': models.Count('id')}
+                for metric, column in cls.METRICS.items():
+                    aggregates.update({
+                        f'{metric}_min': models.Min(column),
+                        f'{metric}_max': models.Max(column),
+                        f'{metric}_mean': models.Avg(column),
+                        f'{metric}_count': models.Count(column),
+                    })
+                rows = DailyRecord.objects.filter(
+                    patient_id__in=patient_ids, date__gte=start, date__lt=end
+                ).annotate(period_start=trunc('date')).values('patient_id', 'period_start').annotate(**aggregates)
+
+                cls.objects.filter(
+                    patient_id__in=patient_ids, granularity=granularity,
+                    period_start__gte=start, period_start__lt=end
+                ).delete()
+                # INSERT ... SELECT keeps the aggregated buckets inside SQLite
+                qn = connection.ops.quote_name
+                select_sql, params = rows.query.sql_with_params()
+                columns = ['patient_id', 'period_start', *aggregates]
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"INSERT INTO {qn(cls._meta.db_table)} ({qn('granularity')}, "
+                        f"{', '.join(qn(column) for column in columns)}) SELECT %s, * FROM ({select_sql})",
+                        [granularity, *params]
+                    )
+
+class SyncTombstone(models.Model):
+    """Deleted synced rows, recorded by triggers so /api/sync can report them."""
+    table = models.CharField(max_length=40)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'sync_tombstone'
+        indexes = [models.Index(fields=['change_seq'], name='sync_tombstone_change_seq_idx')]
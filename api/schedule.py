@@ -0,0 +1,115 @@
+"""
+Calendar schedule engine: lazily expands medications and daily vitals into
+dated events for a requested window.
+"""
+from datetime import date, timedelta
+
+# Nominal clock time for each timing value, used to order a day's events
+TIMING_SLOTS = {
+    'morning': '08:00',
+    'before_food': '12:30',
+    'afternoon': '13:00',
+    'after_food': '13:30',
+    'evening': '18:00',
+    'night': '21:00',
+}
+ANY_TIME = '23:59'
+VITALS_TIME = '09:00'
+
+
+def medication_event_id(medication_id, day):
+    return f"med-{medication_id}-{day:%Y%m%d}"
+
+
+def vitals_event_id(patient_id, day):
+    return f"vitals-{patient_id}-{day:%Y%m%d}"
+
+
+def parse_event_id(event_id):
+    """Split an event id into (kind, object id, date); raises ValueError if malformed."""
+    kind, object_id, day = event_id.split('-')
+    if kind not in ('med', 'vitals'):
+        raise ValueError(f"Unknown event type: {kind}")
+    return kind, int(object_id), date(int(day[:4]), int(day[4:6]), int(day[6:8]))
+
+
+def days_between(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def course_window(med, start, end):
+    """
+    Clip the window to the days the medication's course is active, and the
+    patient admitted, or None.
+    """
+    joined = med['patient__date_of_joining']
+    first = med['start_date'] or joined or start
+    last = first + timedelta(days=med['duration_days'] - 1) if med['duration_days'] else end
+    first, last = max(first, joined or first, start), min(last, end)
+    return (first, last) if first <= last else None
+
+
+def expand_events(medications, patients, start, end, given, recorded):
+    """
+    Yield events in (date, time) order for [start, end].
+
+    `medications` and `patients` are values() rows; `given` holds the
+    (medication_id, date) pairs with a logged dose and `recorded` the
+    (patient_id, date) pairs with a daily record. Only days inside the
+    window are ever visited, so cost follows the window size and not how
+    long anyone has been admitted.
+    """
+    windows = {}
+    for med in medications:
+        window = course_window(med, start, end)
+        if window:
+            windows[med['id']] = window
+    by_slot = sorted(
+        (med for med in medications if med['id'] in windows),
+        key=lambda med: (TIMING_SLOTS.get(med['timing'], ANY_TIME), med['id'])
+    )
+
+    for day in days_between(start, end):
+        vitals_pending = True
+        for med in by_slot:
+            first, last = windows[med['id']]
+            if not first <= day <= last:
+                continue
+            slot = TIMING_SLOTS.get(med['timing'], ANY_TIME)
+            if vitals_pending and slot > VITALS_TIME:
+                yield from _vitals_events(patients, day, recorded)
+                vitals_pending = False
+            yield {
+                "id": medication_event_id(med['id'], day),
+                "type": "medication",
+                "date": day.isoformat(),
+                "time": slot if med['timing'] in TIMING_SLOTS else None,
+                "title": f"{med['name']} ({med['dose']})",
+                "patient_id": med['patient_id'],
+                "patient_name": med['patient__name'],
+                "medication_id": med['id'],
+                "timing": med['timing'],
+                "food_relation": med['food_relation'],
+                "completed": (med['id'], day) in given,
+            }
+        if vitals_pending:
+            yield from _vitals_events(patients, day, recorded)
+
+
+def _vitals_events(patients, day, recorded):
+    for patient in patients:
+        if patient['date_of_joining'] and patient['date_of_joining'] > day:
+            continue
+        yield {
+            "id": vitals_event_id(patient['id'], day),
+            "type": "vitals",
+            "date": day.isoformat(),
+            "time": VITALS_TIME,
+            "title": "Daily health update",
+            "patient_id": patient['id'],
+            "patient_name": patient['name'],
+            "completed": (patient['id'], day) in recorded,
+        }
@@ -0,0 +1,190 @@
+"""
+Projection serializers: each resource declares its output fields once, and
+the declaration compiles to a values_list() query plus a row -> dict mapping,
+so list responses never instantiate models.
+"""
+from functools import lru_cache
+from .models import DailyRecord
+
+KNOWN_TIMINGS = [None, 'morning', 'afternoon', 'evening', 'night', 'before_food', 'after_food']
+KNOWN_FOOD_RELATIONS = [None, 'before_food', 'after_food']
+
+
+def _compute_timing_display(timing, food_relation):
+    timing_display = timing.capitalize() if timing else "Any time"
+    if food_relation:
+        food_text = "Before Food" if food_relation == "before_food" else "After Food"
+        timing_display += f" • {food_text}"
+    return timing_display
+
+
+# Precomputed for every known combination; anything else is computed on demand
+TIMING_DISPLAY = {
+    (timing, food_relation): _compute_timing_display(timing, food_relation)
+    for timing in KNOWN_TIMINGS for food_relation in KNOWN_FOOD_RELATIONS
+}
+
+
+def timing_display(timing, food_relation):
+    display = TIMING_DISPLAY.get((timing, food_relation))
+    return display if display is not None else _compute_timing_display(timing, food_relation)
+
+
+# Readings and dates repeat heavily across rows, so memoize their rendering
+bp_display = lru_cache(maxsize=4096)(DailyRecord.bp_display)
+
+
+@lru_cache(maxsize=4096)
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Field:
+    """Output field copied from one column (defaults to the field's own name)."""
+    def __init__(self, source=None):
+        self.source = source
+
+
+class Derived:
+    """Output field computed by `func` from one or more columns."""
+    def __init__(self, func, *sources):
+        self.func = func
+        self.sources = sources
+
+
+class Serializer:
+    """
+    Subclasses declare `fields` (output name -> Field/Derived). An instance,
+    optionally limited to a subset of names, exposes the `columns` to select
+    and `to_dict(row)` for one values_list() row.
+    """
+    fields = {}
+
+    def __init__(self, *only):
+        names = list(only) if only else list(self.fields)
+        unknown = set(names) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        # Every column needed once, in first-use order
+        self.columns = []
+        def index(column):
+            if column not in self.columns:
+                self.columns.append(column)
+            return self.columns.index(column)
+
+        # (output name, column index) for copied fields and (output name,
+        # function, column indexes) for derived ones, resolved once here so
+        # to_dict only indexes into the row
+        entries = []
+        for name in names:
+            spec = self.fields[name]
+            if isinstance(spec, Derived):
+                entries.append((name, None, spec.func, tuple(index(source) for source in spec.sources)))
+            else:
+                entries.append((name, index(spec.source or name), None, None))
+        entries = tuple(entries)
+
+        def to_dict(row):
+            return {
+                name: row[position] if func is None else func(*[row[i] for i in args])
+                for name, position, func, args in entries
+            }
+        self.to_dict = to_dict
+
+    def rows(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def from_instance(self, obj):
+        return self.to_dict(tuple(getattr(obj, column) for column in self.columns))
+
+    def serialize(self, queryset):
+        to_dict = self.to_dict
+        return [to_dict(row) for row in self.rows(queryset)]
+
+    def iterate(self, queryset, chunk_size):
+        to_dict = self.to_dict
+        return (to_dict(row) for row in self.rows(queryset).iterator(chunk_size=chunk_size))
+
+    async def aserialize(self, queryset):
+        to_dict = self.to_dict
+        return [to_dict(row) async for row in self.rows(queryset)]
+
+
+class PatientSerializer(Serializer):
+    fields = {
+        'id': Field(),
+        'name': Field(),
+        'age': Field(),
+        'gender': Field(),
+        'chief_complaint': Field(),
+        'date_of_joining': Derived(isoformat, 'date_of_joining'),
+    }
+
+
+class MedicationSerializer(Serializer):
+    # is_given_today reads the `given_today` annotation from with_given_on()
+    fields = {
+        'id': Field(),
+        'patient_id': Field(),
+        'name': Field(),
+        'dose': Field(),
+        'timing': Field(),
+        'timing_display': Derived(timing_display, 'timing', 'food_relation'),
+        'type': Field(),
+        'food_relation': Field(),
+        'is_given_today': Field('given_today'),
+    }
+
+
+class PendingMedicationSerializer(Serializer):
+    fields = {
+        'medication_id': Field('id'),
+        'patient_name': Field('patient__name'),
+        'medicine_name': Field('name'),
+        'dose': Field(),
+        'timing_display': Derived(timing_display, 'timing', 'food_relation'),
+        'type': Field(),
+        'timing': Field(),
+        'food_relation': Field(),
+    }
+
+
+class DailyRecordSerializer(Serializer):
+    fields = {
+        'id': Field(),
+        'patient_id': Field(),
+        'date': Derived(isoformat, 'date'),
+        'weight': Field(),
+        'bp': Derived(bp_display, 'bp', 'bp_systolic', 'bp_diastolic'),
+        'notes': Field(),
+    }
+
+
+# Sync payloads carry the full row (course window, updated_at) but no
+# day-dependent state: tablets derive "given today" from the administrations
+class SyncPatientSerializer(Serializer):
+    fields = {**PatientSerializer.fields, 'updated_at': Field()}
+
+
+class SyncMedicationSerializer(Serializer):
+    fields = {
+        **{name: spec for name, spec in MedicationSerializer.fields.items() if name != 'is_given_today'},
+        'start_date': Derived(isoformat, 'start_date'),
+        'duration_days': Field(),
+        'updated_at': Field(),
+    }
+
+
+class SyncDailyRecordSerializer(Serializer):
+    fields = {**DailyRecordSerializer.fields, 'updated_at': Field()}
+
+
+class AdministrationSerializer(Serializer):
+    fields = {
+        'id': Field(),
+        'medication_id': Field(),
+        'patient_id': Field(),
+        'date': Derived(isoformat, 'date'),
+        'given_at': Field(),
+    }
@@ -0,0 +1,43 @@
+"""
+Delta sync: every insert, update and delete on the synced tables takes the
+next value of one global sequence (triggers in migration 0008), so "what
+changed since X" is a range read on each table's change_seq index.
+"""
+import base64
+from django.db import connections, router
+from .models import Patient, Medication, MedicationAdministration, DailyRecord, SyncTombstone
+from .serializers import (
+    AdministrationSerializer, SyncDailyRecordSerializer, SyncMedicationSerializer, SyncPatientSerializer
+)
+
+# Response key, model and serializer per synced table, parents first
+SYNC_RESOURCES = [
+    ('patients', Patient, SyncPatientSerializer()),
+    ('medications', Medication, SyncMedicationSerializer()),
+    ('daily_records', DailyRecord, SyncDailyRecordSerializer()),
+    ('administrations', MedicationAdministration, AdministrationSerializer()),
+]
+RESOURCE_BY_TABLE = {model._meta.db_table: name for name, model, _ in SYNC_RESOURCES}
+
+CURSOR_PREFIX = 'v1.'
+
+
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(f'{CURSOR_PREFIX}{seq}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Sequence number behind a cursor; raises ValueError if it isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not raw.startswith(CURSOR_PREFIX) or not raw[len(CURSOR_PREFIX):].isdigit():
+        raise ValueError("Invalid cursor")
+    return int(raw[len(CURSOR_PREFIX):])
+
+
+def current_sequence():
+    with connections[router.db_for_read(SyncTombstone)].cursor() as cursor:
+        cursor.execute("SELECT value FROM sync_sequence")
+        return cursor.fetchone()[0]
@@ -1,3 +1,995 @@
-from django.test import TestCase
+import csv
+import json
+import re
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from .cache import PATIENT_JSON_CACHE, dashboard_cache_key
+from .downsample import lttb
+from .facilities import (
+    FACILITY_HEADER, FacilityRouter, allow_replica_reads, end_replica_reads, facilities, using_facility
+)
+from .metrics import JsonLogFormatter, cache_stats, registry
+from .models import Patient, Medication, MedicationAdministration, DailyRecord, SyncTombstone
+from .schedule import expand_events, medication_event_id, parse_event_id, vitals_event_id
+from .serializers import DailyRecordSerializer
+from .views import PATIENT_LIST_FIELDS, REPORT_CSV_COLUMNS
 
-# Create your tests here.
+
+class FacilityClient(Client):
+    """Test client whose requests name the default facility, as a tablet's do."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, headers={FACILITY_HEADER: facilities()[0]}, **kwargs)
+
+
+@override_settings(REPLICA_DATABASES={})
+class APITestCase(TestCase):
+    # The default facility is the one TestCase's default database holds. Reads
+    # stay on it: a replica can't see the test's uncommitted rows.
+    client_class = FacilityClient
+
+
+def make_patients(count, days=3, meds=2):
+    today = date.today()
+    for i in range(count):
+        patient = Patient.objects.create(name=f"Patient {i}", age=70 + i % 20, gender="Female")
+        for m in range(meds):
+            Medication.objects.create(patient=patient, name=f"Med {m}", dose="1 tab", timing="morning")
+        for d in range(days):
+            DailyRecord.objects.create(patient=patient, date=today - timedelta(days=d), weight=60.0, bp="120/80")
+
+
+class ReportsDataTests(APITestCase):
+    def get_report(self):
+        today = date.today()
+        return self.client.get('/api/reports', {
+            'from_date': (today - timedelta(days=30)).isoformat(),
+            'to_date': today.isoformat(),
+        })
+
+    def count_report_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get_report()
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_is_flat_in_patient_count(self):
+        make_patients(2)
+        small, _ = self.count_report_queries()
+        make_patients(40)
+        large, data = self.count_report_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['patients']), 42)
+
+    def test_records_limited_to_date_range(self):
+        make_patients(1, days=3)
+        patient = Patient.objects.get()
+        DailyRecord.objects.create(patient=patient, date=date.today() - timedelta(days=90), weight=61.0)
+
+        _, data = self.count_report_queries()
+        entry = data['patients'][0]
+
+        self.assertEqual(len(entry['daily_records']), 3)
+        self.assertEqual(len(entry['medications']), 2)
+        self.assertEqual(entry['daily_records'][0]['bp'], "120/80")
+
+
+    def test_adherence_covers_every_admitted_day_against_each_course(self):
+        today = date.today()
+        patient = Patient.objects.create(
+            name="Adherent", age=80, gender="Female", date_of_joining=today - timedelta(days=3)
+        )
+        daily = Medication.objects.create(patient=patient, name="Daily", dose="1 tab", timing="morning")
+        one_day = Medication.objects.create(patient=patient, name="Once", dose="1 tab", timing="night",
+                                            start_date=today - timedelta(days=2), duration_days=1)
+        now = timezone.now()
+        for med, days_ago in ((daily, 3), (one_day, 2), (daily, 1), (one_day, 0)):
+            MedicationAdministration.objects.create(
+                medication=med, patient=patient, date=today - timedelta(days=days_ago), given_at=now
+            )
+
+        response = self.client.get('/api/reports', {
+            'from_date': (today - timedelta(days=5)).isoformat(),
+            'to_date': (today + timedelta(days=2)).isoformat(),
+        })
+        adherence = response.json()['patients'][0]['adherence']
+
+        # From admission to today; the dose logged after its course ended doesn't count
+        self.assertEqual(
+            [(day['date'], day['given'], day['scheduled'], day['medication_ids']) for day in adherence['days']],
+            [((today - timedelta(days=3)).isoformat(), 1, 1, [daily.id]),
+             ((today - timedelta(days=2)).isoformat(), 1, 2, [one_day.id]),
+             ((today - timedelta(days=1)).isoformat(), 1, 1, [daily.id]),
+             (today.isoformat(), 0, 1, [])]
+        )
+        self.assertEqual(adherence['days'][1]['percentage'], 50.0)
+        self.assertEqual(
+            (adherence['doses_given'], adherence['doses_scheduled'], adherence['percentage']), (3, 5, 60.0)
+        )
+
+    def get_stream(self, output_format, **params):
+        today = date.today()
+        response = self.client.get('/api/reports', {
+            'from_date': (today - timedelta(days=30)).isoformat(),
+            'to_date': today.isoformat(),
+            'format': output_format,
+            **params,
+        })
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else None
+        return response, body
+
+    def test_ndjson_streams_one_entry_per_patient(self):
+        make_patients(2, days=2)
+        first = Patient.objects.order_by('id').first()
+
+        response, body = self.get_stream('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        entries = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([entry['patient']['id'] for entry in entries], list(
+            Patient.objects.order_by('id').values_list('id', flat=True)
+        ))
+        self.assertEqual(len(entries[0]['daily_records']), 2)
+        self.assertEqual(entries[0]['daily_records'][0]['bp'], "120/80")
+        self.assertEqual(len(entries[0]['medications']), 2)
+
+        _, body = self.get_stream('ndjson', patient_id=first.id)
+        self.assertEqual([json.loads(line)['patient']['id'] for line in body.splitlines()], [first.id])
+
+    def test_csv_streams_a_header_and_one_row_per_record(self):
+        make_patients(2, days=2)
+        first = Patient.objects.order_by('id').first()
+
+        response, body = self.get_stream('csv', patient_id=first.id)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment; filename="report_'))
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0], REPORT_CSV_COLUMNS)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[0] for row in rows[1:]}, {str(first.id)})
+        self.assertEqual(rows[1][1], first.name)
+
+    def test_invalid_parameters_fail_before_streaming(self):
+        make_patients(1, days=1)
+        for output_format in ('json', 'ndjson', 'csv'):
+            for params in ({'patient_id': 'abc'}, {'patient_id': '1.5'}, {'from_date': '2024-13-01'}):
+                response, _ = self.get_stream(output_format, **params)
+                self.assertEqual(response.status_code, 400, (output_format, params))
+                self.assertFalse(response.streaming)
+
+
+class DashboardTests(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.key = dashboard_cache_key(date.today())
+
+    def test_query_count_is_flat_in_patient_count(self):
+        make_patients(2)
+        with self.assertNumQueries(4):
+            self.client.get('/api/dashboard')
+        caches['default'].clear()
+        make_patients(30)
+        with self.assertNumQueries(4):
+            data = self.client.get('/api/dashboard').json()
+        self.assertEqual(data['total_patients'], 32)
+        # A cached snapshot needs no queries at all
+        with self.assertNumQueries(0):
+            self.client.get('/api/dashboard')
+
+    def test_writes_drop_the_snapshot_on_commit(self):
+        make_patients(1, days=0, meds=1)
+        patient = Patient.objects.get()
+        medication = Medication.objects.get()
+        writes = [
+            lambda: self.client.patch(f'/api/medications/mark_given/{medication.id}'),
+            lambda: self.client.post('/api/daily/record', json.dumps({'patient_id': patient.id, 'bp': '120/80'}),
+                                     content_type='application/json'),
+        ]
+        for write in writes:
+            self.client.get('/api/dashboard')
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertEqual(write().status_code, 200)
+                # Not before the write commits
+                self.assertIsNotNone(caches['default'].get(self.key))
+            self.assertTrue(callbacks)
+            self.assertIsNone(caches['default'].get(self.key))
+
+        data = self.client.get('/api/dashboard').json()
+        self.assertEqual(data['medication_progress']['given'], 1)
+        self.assertEqual(data['pending_health_updates'], [])
+
+
+class SerializerTests(APITestCase):
+    def test_projection_matches_instance(self):
+        make_patients(1, days=1)
+        record = DailyRecord.objects.get()
+        serializer = DailyRecordSerializer()
+        row = serializer.rows(DailyRecord.objects.all()).get()
+
+        self.assertEqual(serializer.to_dict(row), serializer.from_instance(record))
+        self.assertEqual(serializer.to_dict(row)['date'], date.today().isoformat())
+
+    def test_medicines_timing_display(self):
+        make_patients(1, days=0, meds=1)
+        medication = Medication.objects.get()
+        Medication.objects.filter(id=medication.id).update(food_relation='after_food')
+
+        data = self.client.get(f'/api/patients/{medication.patient_id}/medicines').json()
+        self.assertEqual(data[0]['timing_display'], "Morning • After Food")
+        self.assertFalse(data[0]['is_given_today'])
+
+
+class PatientListTests(APITestCase):
+    def setUp(self):
+        make_patients(5, days=0, meds=0)
+        self.ids = list(Patient.objects.order_by('-id').values_list('id', flat=True))
+
+    def get(self, **params):
+        return self.client.get('/api/patients', params)
+
+    def test_without_paging_returns_the_whole_roster(self):
+        data = self.get().json()
+        self.assertEqual([row['id'] for row in data], self.ids)
+        self.assertEqual(set(data[0]), set(PATIENT_LIST_FIELDS))
+
+    def test_keyset_pages_follow_the_next_cursor(self):
+        pages = [self.get(limit=2).json()]
+        while pages[-1]['next'] is not None:
+            pages.append(self.get(limit=2, after_id=pages[-1]['next']).json())
+
+        self.assertEqual([[row['id'] for row in page['results']] for page in pages],
+                         [self.ids[0:2], self.ids[2:4], self.ids[4:]])
+        self.assertEqual([page['next'] for page in pages], [self.ids[1], self.ids[3], None])
+
+    def test_an_exactly_full_last_page_has_no_next(self):
+        data = self.get(limit=5).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.get(limit=2, after_id=self.ids[-1]).json(), {'results': [], 'next': None})
+
+    def test_fields_projection(self):
+        data = self.get(fields='name, age').json()
+        self.assertEqual(set(data[0]), {'id', 'name', 'age'})
+        page = self.get(fields='gender', limit=1).json()
+        self.assertEqual(page['results'], [{'id': self.ids[0], 'gender': 'Female'}])
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'name,password'}, {'limit': 0}, {'limit': -1}, {'limit': 'ten'},
+                       {'after_id': 'x'}):
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+        self.assertEqual(self.get(fields='ssn').json()['error'], 'Unknown fields: ssn')
+
+
+class PatientSearchTests(APITestCase):
+    def search(self, q):
+        return [p['name'] for p in self.client.get('/api/patients/search', {'q': q}).json()]
+
+    def test_prefix_match_ranks_names_above_complaints(self):
+        Patient.objects.create(name="Sita Devi", age=80, gender="Female", chief_complaint="Ramesh's sister")
+        Patient.objects.create(name="Ramesh Kumar", age=75, gender="Male", chief_complaint="Hypertension")
+        Patient.objects.create(name="Mohan Lal", age=70, gender="Male", chief_complaint="Knee pain")
+
+        self.assertEqual(self.search('rame'), ["Ramesh Kumar", "Sita Devi"])
+        self.assertEqual(self.search('kum hyper'), ["Ramesh Kumar"])
+        self.assertEqual(self.search('"OR*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        patient = Patient.objects.create(name="Geeta Joshi", age=80, gender="Female")
+        Patient.objects.filter(id=patient.id).update(name="Geeta Sharma")
+        self.assertEqual(self.search('sharma'), ["Geeta Sharma"])
+        self.assertEqual(self.search('joshi'), [])
+
+        patient.delete()
+        self.assertEqual(self.search('geeta'), [])
+
+
+class SyncTests(APITestCase):
+    def sync(self, since=None):
+        response = self.client.get('/api/sync', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_delta_returns_only_changes_and_deletions(self):
+        make_patients(2, days=2, meds=2)
+        snapshot = self.sync()
+        self.assertEqual((len(snapshot['patients']), len(snapshot['medications'])), (2, 4))
+        self.assertEqual(len(snapshot['daily_records']), 4)
+        self.assertFalse(snapshot['has_more'])
+
+        self.assertEqual(self.sync(snapshot['cursor'])['patients'], [])
+
+        patient = Patient.objects.first()
+        Patient.objects.filter(id=patient.id).update(age=99)
+        medication = Medication.objects.filter(patient=patient).first()
+        self.client.patch(f'/api/medications/mark_given/{medication.id}')
+        deleted_id = DailyRecord.objects.filter(patient=patient).first().id
+        DailyRecord.objects.filter(id=deleted_id).delete()
+
+        delta = self.sync(snapshot['cursor'])
+        self.assertEqual([p['age'] for p in delta['patients']], [99])
+        self.assertEqual([a['medication_id'] for a in delta['administrations']], [medication.id])
+        self.assertEqual(delta['medications'], [])
+        self.assertEqual(delta['deleted']['daily_records'], [deleted_id])
+
+    def test_pages_never_skip_changes(self):
+        make_patients(3, days=3, meds=1)
+        seen, cursor = 0, None
+        with patch('api.views.SYNC_PAGE_SIZE', 2):
+            while True:
+                page = self.sync(cursor)
+                seen += sum(len(page[key]) for key in ('patients', 'medications', 'daily_records'))
+                cursor = page['cursor']
+                if not page['has_more']:
+                    break
+        self.assertEqual(seen, 3 + 3 + 9)
+
+    def test_rejects_foreign_cursor(self):
+        self.assertEqual(self.client.get('/api/sync', {'since': 'garbage'}).status_code, 400)
+
+
+class AdministrationLogTests(APITestCase):
+    def test_each_dose_is_logged_once_per_day(self):
+        make_patients(1, days=0, meds=2)
+        first, second = Medication.objects.order_by('id')
+        self.client.patch(f'/api/medications/mark_given/{first.id}')
+
+        response = self.client.post('/api/medications/mark_given', json.dumps({
+            'medication_ids': [first.id, second.id, second.id + 100]
+        }), content_type='application/json')
+
+        self.assertEqual(response.json(), {
+            'marked': [second.id], 'already_given': [first.id], 'not_found': [second.id + 100]
+        })
+        self.assertEqual(
+            sorted(MedicationAdministration.objects.values_list('medication_id', 'patient_id', 'date')),
+            [(first.id, first.patient_id, date.today()), (second.id, second.patient_id, date.today())]
+        )
+
+
+class SeedDataTests(APITestCase):
+    def test_seeds_the_administration_log_at_the_dose_rate(self):
+        call_command('seed_data', patients=6, days=5, seed=1, stdout=StringIO())
+        self.assertTrue(0 < MedicationAdministration.objects.count() < Medication.objects.count() * 4)
+
+        call_command('seed_data', patients=6, days=5, seed=1, dose_rate=1, stdout=StringIO())
+        doses = MedicationAdministration.objects.values_list('medication__patient_id', 'patient_id', 'date')
+        # Every dose of the four past days, none for today, each under its own patient
+        self.assertEqual(len(doses), Medication.objects.count() * 4)
+        self.assertTrue(all(med_patient == patient and day < date.today() for med_patient, patient, day in doses))
+
+        call_command('seed_data', patients=6, days=5, seed=1, dose_rate=0, stdout=StringIO())
+        self.assertFalse(MedicationAdministration.objects.exists())
+
+    def test_reseed_leaves_triggers_indexes_and_their_state_in_place(self):
+        def schema():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'index')")
+                return set(cursor.fetchall())
+        before = schema()
+        for _ in range(2):
+            call_command('seed_data', patients=6, days=5, seed=1, stdout=StringIO())
+
+        self.assertEqual(schema(), before)
+        self.assertFalse(SyncTombstone.objects.exists())
+        # Search index, versions and sync stamps rebuilt for the loaded rows
+        patient = Patient.objects.order_by('id').first()
+        names = [p['name'] for p in self.client.get('/api/patients/search', {'q': patient.name}).json()]
+        self.assertIn(patient.name, names)
+        self.assertFalse(Patient.objects.filter(version=0).exists())
+        stamps = [seq for model in (Patient, Medication, DailyRecord, MedicationAdministration)
+                  for seq in model.objects.values_list('change_seq', flat=True)]
+        self.assertNotIn(None, stamps)
+        self.assertEqual(len(set(stamps)), len(stamps))
+        # The triggers are back: a write bumps the version and takes a sync stamp
+        version = patient.version
+        DailyRecord.objects.create(patient=patient, date=date.today() - timedelta(days=30), weight=60.0)
+        patient.refresh_from_db()
+        self.assertEqual(patient.version, version + 1)
+        self.assertGreater(DailyRecord.objects.latest('id').change_seq, max(stamps))
+
+
+class StartMedicationDayTests(APITestCase):
+    def test_resets_stale_flags_and_archives_unlogged_doses_once(self):
+        make_patients(1, days=0, meds=3)
+        unlogged, logged, current = Medication.objects.order_by('id')
+        yesterday = date.today() - timedelta(days=1)
+        last_night = timezone.make_aware(datetime.combine(yesterday, time(21, 0)))
+        Medication.objects.filter(id__in=[unlogged.id, logged.id]).update(is_given_today=True, given_at=last_night)
+        MedicationAdministration.objects.create(
+            medication=logged, patient=logged.patient, date=yesterday, given_at=last_night
+        )
+        self.client.patch(f'/api/medications/mark_given/{current.id}')
+
+        for _ in range(2):
+            call_command('start_medication_day', facility=[facilities()[0]], stdout=StringIO())
+
+        flags = dict(Medication.objects.values_list('id', 'is_given_today'))
+        self.assertEqual(flags, {unlogged.id: False, logged.id: False, current.id: True})
+        self.assertEqual(
+            set(MedicationAdministration.objects.values_list('medication_id', 'date')),
+            {(unlogged.id, yesterday), (logged.id, yesterday), (current.id, date.today())}
+        )
+
+
+class CalendarTests(APITestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.patient = Patient.objects.create(
+            name="Joined", age=80, gender="Male", date_of_joining=self.today - timedelta(days=5)
+        )
+        # A three-day course that started the day after admission
+        self.course = Medication.objects.create(
+            patient=self.patient, name="Antibiotic", dose="1 tab", timing="evening",
+            start_date=self.today - timedelta(days=4), duration_days=3
+        )
+
+    def complete(self, day):
+        return self.client.post(f'/api/calendar/events/{medication_event_id(self.course.id, day)}/complete')
+
+    def test_parse_event_id(self):
+        day = date(2024, 3, 9)
+        self.assertEqual(parse_event_id(medication_event_id(12, day)), ('med', 12, day))
+        self.assertEqual(parse_event_id(vitals_event_id(7, day)), ('vitals', 7, day))
+        for bad in ('med-12', 'lab-1-20240309', 'med-x-20240309', 'med-1-20241399'):
+            with self.assertRaises(ValueError):
+                parse_event_id(bad)
+
+    def test_expand_events_follows_the_course_and_admission(self):
+        med = {
+            'id': 1, 'patient_id': 1, 'patient__name': "Joined", 'patient__date_of_joining': date(2024, 3, 3),
+            'name': "Antibiotic", 'dose': "1 tab", 'timing': 'evening', 'food_relation': None,
+            'start_date': date(2024, 3, 1), 'duration_days': 4,
+        }
+        patient = {'id': 1, 'name': "Joined", 'date_of_joining': date(2024, 3, 3)}
+        events = list(expand_events(
+            [med], [patient], date(2024, 3, 1), date(2024, 3, 6), {(1, date(2024, 3, 4))}, set()
+        ))
+
+        # Doses on the course days since admission; health updates every day since admission
+        self.assertEqual(
+            [(e['type'], e['date'], e['completed']) for e in events],
+            [('vitals', '2024-03-03', False), ('medication', '2024-03-03', False),
+             ('vitals', '2024-03-04', False), ('medication', '2024-03-04', True),
+             ('vitals', '2024-03-05', False), ('vitals', '2024-03-06', False)]
+        )
+
+    def test_complete_event_logs_a_dose_on_a_course_day(self):
+        day = self.today - timedelta(days=3)
+        self.assertEqual(self.complete(day).json(), {'message': 'Event marked as completed'})
+        self.assertEqual(self.complete(day).json(), {'message': 'Event already completed'})
+        self.assertEqual(
+            list(MedicationAdministration.objects.values_list('medication_id', 'date')), [(self.course.id, day)]
+        )
+
+    def test_complete_event_rejects_days_without_a_dose(self):
+        before_course, after_course = self.today - timedelta(days=5), self.today - timedelta(days=1)
+        for day in (before_course, after_course, self.today + timedelta(days=1)):
+            self.assertEqual(self.complete(day).status_code, 400)
+        self.assertFalse(MedicationAdministration.objects.exists())
+
+    def test_complete_event_rejects_days_before_admission(self):
+        open_ended = Medication.objects.create(patient=self.patient, name="Vitamin D", dose="1 tab", timing="morning",
+                                               start_date=self.today - timedelta(days=10))
+        day = self.today - timedelta(days=6)
+        response = self.client.post(f'/api/calendar/events/{medication_event_id(open_ended.id, day)}/complete')
+        self.assertEqual(response.status_code, 400)
+
+    def test_complete_event_errors(self):
+        self.assertEqual(self.client.post('/api/calendar/events/garbage/complete').status_code, 400)
+        self.assertEqual(self.client.post(
+            f'/api/calendar/events/{vitals_event_id(self.patient.id, self.today)}/complete'
+        ).status_code, 400)
+        self.assertEqual(self.client.post(
+            f'/api/calendar/events/{medication_event_id(self.course.id + 100, self.today)}/complete'
+        ).status_code, 404)
+        self.assertEqual(self.client.get(
+            f'/api/calendar/events/{medication_event_id(self.course.id, self.today)}/complete'
+        ).status_code, 405)
+
+
+class FacilityRoutingTests(APITestCase):
+    def test_unknown_facility_is_rejected(self):
+        response = self.client.get('/api/patients', HTTP_X_FACILITY='nowhere')
+        self.assertEqual(response.status_code, 400)
+
+    def test_responses_vary_by_facility(self):
+        response = self.client.get('/api/patients', HTTP_X_FACILITY=facilities()[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Facility', response['Vary'])
+
+    @override_settings(REPLICA_DATABASES={'default': 'default_replica'})
+    def test_reads_use_the_replica_until_the_request_writes(self):
+        router = FacilityRouter()
+        self.assertEqual(router.db_for_read(Patient), 'default')
+        token = allow_replica_reads()
+        try:
+            self.assertEqual(router.db_for_read(Patient), 'default_replica')
+            loaded = Patient(id=1)
+            loaded._state.db = 'default_replica'
+            self.assertEqual(router.db_for_write(Patient, instance=loaded), 'default')
+            self.assertEqual(router.db_for_read(Patient), 'default')
+        finally:
+            end_replica_reads(token)
+
+
+@skipUnless(len(settings.FACILITIES) > 1, "Needs FACILITIES to configure at least two facilities")
+@override_settings(REPLICA_DATABASES={})
+class FacilityShardingTests(TransactionTestCase):
+    # Fan-out threads can't see rows inside another thread's open test transaction
+    databases = '__all__'
+
+    def setUp(self):
+        # Dashboard snapshots outlive the flush between these tests
+        caches['default'].clear()
+        self.main, self.other = facilities()[:2]
+        for facility, count in ((self.main, 2), (self.other, 3)):
+            with using_facility(facility):
+                make_patients(count, meds=1)
+
+    def test_requests_see_only_their_facility(self):
+        for facility, count in ((self.main, 2), (self.other, 3)):
+            patients = self.client.get('/api/patients', HTTP_X_FACILITY=facility).json()
+            self.assertEqual(len(patients), count)
+        patient_id = patients[0]['id']
+        medicine = self.client.get(f'/api/patients/{patient_id}/medicines', HTTP_X_FACILITY=self.other).json()[0]
+        self.client.patch(f"/api/medications/mark_given/{medicine['id']}", HTTP_X_FACILITY=self.other)
+
+        with using_facility(self.other):
+            self.assertEqual(MedicationAdministration.objects.count(), 1)
+        with using_facility(self.main):
+            self.assertEqual(MedicationAdministration.objects.count(), 0)
+
+    def test_facility_scoped_requests_need_a_facility(self):
+        with using_facility(self.main):
+            patient_id = Patient.objects.values_list('id', flat=True).first()
+        for method, path in (
+            ('get', f'/api/patients/{patient_id}'),
+            ('get', f'/api/patients/{patient_id}/medicines'),
+            ('patch', f'/api/medications/mark_given/{patient_id}'),
+            ('post', '/api/daily/record'),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(getattr(self.client, method)(path).status_code, 400)
+        with using_facility(self.main):
+            self.assertEqual(MedicationAdministration.objects.count(), 0)
+        self.assertEqual(self.client.get('/api/dashboard').status_code, 200)
+
+    def test_dashboard_and_reports_merge_every_facility(self):
+        dashboard = self.client.get('/api/dashboard').json()
+        self.assertEqual(dashboard['total_patients'], 5)
+        self.assertEqual(dashboard['medication_progress']['total'], 5)
+        self.assertEqual({med['facility'] for med in dashboard['pending_medications']}, {self.main, self.other})
+        self.assertEqual(self.client.get('/api/dashboard', HTTP_X_FACILITY=self.other).json()['total_patients'], 3)
+
+        today = date.today().isoformat()
+        report = self.client.get('/api/reports', {'from_date': today, 'to_date': today}).json()
+        self.assertEqual([entry['facility'] for entry in report['patients']], [self.main] * 2 + [self.other] * 3)
+
+
+@skipUnless('default' in settings.REPLICA_DATABASES, "Needs a replica of the default database")
+class ReplicaReadTests(TransactionTestCase):
+    databases = '__all__'
+    client_class = FacilityClient
+
+    def setUp(self):
+        caches['default'].clear()
+        make_patients(2, days=0)
+        call_command('sync_replicas', stdout=StringIO())
+
+    def test_get_reads_the_replica_until_sync(self):
+        Patient.objects.create(name="Unsynced", age=80, gender="Male")
+        self.assertEqual(len(self.client.get('/api/patients').json()), 2)
+
+        call_command('sync_replicas', stdout=StringIO())
+        self.assertEqual(len(self.client.get('/api/patients').json()), 3)
+
+    def test_writes_go_to_the_primary_and_later_reads_follow(self):
+        response = self.client.post('/api/patients', json.dumps({'name': 'New', 'age': 81, 'gender': 'Female'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Patient.objects.count(), 3)
+
+        # As a reads_from_replica view would: replica first, the primary after a write
+        token = allow_replica_reads()
+        try:
+            self.assertEqual(Patient.objects.count(), 2)
+            Patient.objects.create(name="Walk-in", age=79, gender="Male")
+            self.assertEqual(Patient.objects.count(), 4)
+        finally:
+            end_replica_reads(token)
+
+
+    def test_only_heavy_read_views_use_the_replica(self):
+        patient = Patient.objects.order_by('id').first()
+        med = patient.medications.order_by('id').first()
+        self.client.patch(f'/api/medications/mark_given/{med.id}')
+        walk_in = Patient.objects.create(name="Walk-in", age=79, gender="Male")
+
+        # Opted in: the list and the dashboard lag until the next sync
+        self.assertEqual(len(self.client.get('/api/patients').json()), 2)
+        self.assertEqual(self.client.get('/api/dashboard').json()['total_patients'], 2)
+        # Per-patient and ETag-validated views read the primary
+        medicines = {m['id']: m for m in self.client.get(f'/api/patients/{patient.id}/medicines').json()}
+        self.assertTrue(medicines[med.id]['is_given_today'])
+        self.assertEqual(self.client.get(f'/api/patients/{walk_in.id}').status_code, 200)
+        # The stale snapshot is cached apart from the one writes invalidate
+        self.assertIsNone(caches['default'].get(dashboard_cache_key(date.today())))
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        make_patients(1)
+        self.patient = Patient.objects.get()
+
+    def test_unchanged_resource_returns_304_from_one_query(self):
+        path = f'/api/patients/{self.patient.id}/records'
+        etag = self.client.get(path)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        records = f'/api/patients/{self.patient.id}/records'
+        medicines = f'/api/patients/{self.patient.id}/medicines'
+        records_etag = self.client.get(records)['ETag']
+        medicines_etag = self.client.get(medicines)['ETag']
+
+        self.client.post('/api/daily/record', json.dumps({'patient_id': self.patient.id, 'bp': '130/85'}),
+                         content_type='application/json')
+        response = self.client.get(records, HTTP_IF_NONE_MATCH=records_etag)
+        self.assertEqual(response.status_code, 200)
+
+        medication = Medication.objects.filter(patient=self.patient).first()
+        self.client.patch(f'/api/medications/mark_given/{medication.id}')
+        response = self.client.get(medicines, HTTP_IF_NONE_MATCH=medicines_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], medicines_etag)
+
+
+class DailyRecordTests(APITestCase):
+    def setUp(self):
+        make_patients(1, days=0, meds=0)
+        self.patient = Patient.objects.get()
+        self.day = date.today() - timedelta(days=1)
+
+    def post_bulk(self, entries):
+        return self.client.post('/api/daily/records/bulk', json.dumps(entries), content_type='application/json')
+
+    def stored(self):
+        return DailyRecord.objects.values('weight', 'bp', 'bp_systolic', 'bp_diastolic', 'notes').get(
+            patient=self.patient, date=self.day
+        )
+
+    def test_upsert_without_weight_keeps_the_stored_weight(self):
+        def post(data):
+            return self.client.post('/api/daily/record', json.dumps({
+                'patient_id': self.patient.id, 'date': self.day.isoformat(), **data
+            }), content_type='application/json')
+        post({'weight': 68.5, 'bp': '120/80'})
+        response = post({'bp': '125/82', 'notes': 'after lunch'})
+
+        # The response reports the kept weight, not the omitted one
+        self.assertEqual(response.json()['data']['weight'], 68.5)
+        self.assertEqual(DailyRecord.objects.count(), 1)
+        self.assertEqual(self.stored(), {
+            'weight': 68.5, 'bp': '125/82', 'bp_systolic': 125, 'bp_diastolic': 82, 'notes': 'after lunch'
+        })
+
+    def test_upsert_model_coalesces_weight(self):
+        DailyRecord.upsert(self.patient.id, self.day, weight=70.0, bp='120/80', bp_systolic=120, bp_diastolic=80)
+        record = DailyRecord.upsert(self.patient.id, self.day, bp='130/85', bp_systolic=130, bp_diastolic=85)
+
+        self.assertEqual(record.weight, 70.0)
+        self.assertEqual(self.stored()['weight'], 70.0)
+        self.assertEqual(self.stored()['bp'], '130/85')
+
+    def test_bulk_rejects_the_whole_batch_when_a_row_is_invalid(self):
+        row = {'patient_id': self.patient.id, 'date': self.day.isoformat()}
+        response = self.post_bulk([
+            {**row, 'weight': 70, 'bp': '120/80'},
+            {**row, 'weight': True},
+            {**row, 'notes': ['not', 'text']},
+            {**row, 'bp': '99999/80'},
+            {**row, 'bp': '1' * 30},
+            {**row, 'bp': {'systolic': 120}},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(result['index'], result.get('error')) for result in response.json()['results']],
+            [(0, None), (1, 'Invalid weight'), (2, 'notes must be a string'), (3, 'Invalid bp'),
+             (4, 'Invalid bp'), (5, 'Invalid bp')]
+        )
+        self.assertFalse(DailyRecord.objects.exists())
+
+    def test_non_finite_weights_are_rejected(self):
+        row = {'patient_id': self.patient.id, 'date': self.day.isoformat()}
+        response = self.post_bulk([{**row, 'weight': weight} for weight in ('nan', 'inf', '-inf', '1e400')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual({result['error'] for result in response.json()['results']}, {'Invalid weight'})
+        response = self.client.post('/api/daily/record', json.dumps({**row, 'weight': 'nan'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DailyRecord.objects.exists())
+
+    def test_bulk_upsert_without_weight_keeps_the_stored_weight(self):
+        row = {'patient_id': self.patient.id, 'date': self.day.isoformat()}
+        self.assertEqual(self.post_bulk([{**row, 'weight': 70, 'bp': '120/80'}]).status_code, 200)
+        self.assertEqual(self.post_bulk([{**row, 'bp': '130/85', 'notes': 'rechecked'}]).status_code, 200)
+
+        self.assertEqual(self.stored(), {
+            'weight': 70.0, 'bp': '130/85', 'bp_systolic': 130, 'bp_diastolic': 85, 'notes': 'rechecked'
+        })
+
+    def test_bulk_repeated_rows_apply_in_order(self):
+        row = {'patient_id': self.patient.id, 'date': self.day.isoformat()}
+        results = self.post_bulk([
+            {**row, 'weight': 70, 'bp': '120/80', 'notes': 'first'},
+            {**row, 'bp': '140/90', 'notes': 'second'},
+        ]).json()['results']
+
+        self.assertEqual(DailyRecord.objects.count(), 1)
+        self.assertEqual(results[0]['id'], results[1]['id'])
+        self.assertEqual(self.stored(), {
+            'weight': 70.0, 'bp': '140/90', 'bp_systolic': 140, 'bp_diastolic': 90, 'notes': 'second'
+        })
+
+
+class VitalsTrendsTests(APITestCase):
+    def post_record(self, patient, day, weight, bp):
+        return self.client.post('/api/daily/record', json.dumps({
+            'patient_id': patient.id, 'date': day.isoformat(), 'weight': weight, 'bp': bp
+        }), content_type='application/json')
+
+    def test_rollup_follows_an_overwritten_record(self):
+        make_patients(1, days=0, meds=0)
+        patient = Patient.objects.get()
+        today = date.today()
+        monday = today - timedelta(days=14 + today.weekday())
+        self.post_record(patient, monday, 60.0, "120/80")
+        self.post_record(patient, monday + timedelta(days=1), 62.0, "140/90")
+        self.post_record(patient, monday + timedelta(days=1), 64.0, "130/70")
+
+        response = self.client.get(f'/api/patients/{patient.id}/trends', {
+            'from_date': monday.isoformat(), 'to_date': (monday + timedelta(days=6)).isoformat()
+        })
+        [week] = response.json()['buckets']
+
+        self.assertEqual((week['period_start'], week['records']), (monday.isoformat(), 2))
+        self.assertEqual(week['weight'], {'min': 60.0, 'max': 64.0, 'mean': 62.0, 'count': 2})
+        self.assertEqual(week['systolic'], {'min': 120, 'max': 130, 'mean': 125.0, 'count': 2})
+        self.assertEqual(week['diastolic'], {'min': 70, 'max': 80, 'mean': 75.0, 'count': 2})
+
+    def test_default_window_etag_changes_with_the_date(self):
+        make_patients(1, days=0, meds=0)
+        patient = Patient.objects.get()
+        url = f'/api/patients/{patient.id}/trends'
+
+        self.assertIn(date.today().isoformat(), self.client.get(url)['ETag'])
+        self.assertNotIn(date.today().isoformat(), self.client.get(url, {'to_date': '2024-01-31'})['ETag'])
+
+
+class PatientJsonCacheTests(APITestCase):
+    def setUp(self):
+        caches[PATIENT_JSON_CACHE].clear()
+        cache_stats.reset()
+        make_patients(1)
+        self.patient = Patient.objects.get()
+
+    def test_repeat_reads_are_served_from_cache(self):
+        path = f'/api/patients/{self.patient.id}/medicines'
+        with CaptureQueriesContext(connection) as first:
+            expected = self.client.get(path).content
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(path).content, expected)
+
+        self.assertLess(len(second.captured_queries), len(first.captured_queries))
+        self.assertEqual(cache_stats.snapshot(), {'medicines': {'hit': 1, 'miss': 1}})
+        body = self.client.get('/api/_metrics').content.decode()
+        self.assertIn('api_cache_requests_total{cache="medicines",result="hit"} 1', body)
+
+    def test_unknown_patient_lists_are_empty(self):
+        for resource in ('records', 'medicines'):
+            response = self.client.get(f'/api/patients/999/{resource}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [])
+        self.assertEqual(cache_stats.snapshot(), {})
+
+    def test_writes_invalidate_cached_lists(self):
+        records = f'/api/patients/{self.patient.id}/records'
+        medicines = f'/api/patients/{self.patient.id}/medicines'
+        self.client.get(records)
+        self.client.get(medicines)
+
+        self.client.post('/api/daily/record', json.dumps({'patient_id': self.patient.id, 'bp': '131/86'}),
+                         content_type='application/json')
+        self.assertIn('131/86', self.client.get(records).content.decode())
+
+        medication = Medication.objects.filter(patient=self.patient).first()
+        self.client.patch(f'/api/medications/mark_given/{medication.id}')
+        given = {m['id']: m['is_given_today'] for m in self.client.get(medicines).json()}
+        self.assertTrue(given[medication.id])
+
+        Medication.objects.filter(id=medication.id).update(dose='2 tab')
+        doses = {m['id']: m['dose'] for m in self.client.get(medicines).json()}
+        self.assertEqual(doses[medication.id], '2 tab')
+        self.assertEqual(cache_stats.snapshot()['medicines'], {'hit': 0, 'miss': 3})
+
+
+class DownsampleTests(APITestCase):
+    def test_lttb_keeps_the_ends_and_the_peaks(self):
+        points = [(x, 60 + x % 7) for x in range(100)]
+        points[41] = (41, 95)
+        sampled = lttb(points, 10)
+
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertIn((41, 95), sampled)
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_lttb_passes_short_series_through(self):
+        points = [(x, x * 2.0) for x in range(5)]
+        for threshold in (5, 6, 2, 0):
+            self.assertEqual(lttb(points, threshold), points)
+        self.assertEqual(lttb([], 3), [])
+
+    def test_max_points_bounds_every_series(self):
+        make_patients(1, days=0, meds=0)
+        patient = Patient.objects.get()
+        today = date.today()
+        for i in range(30):
+            DailyRecord.objects.create(patient=patient, date=today - timedelta(days=i), weight=60 + i % 4,
+                                       bp="120/80", bp_systolic=120, bp_diastolic=80)
+        path = f'/api/patients/{patient.id}/records'
+
+        data = self.client.get(path, {'max_points': 8}).json()
+        self.assertEqual((data['max_points'], data['total_records']), (8, 30))
+        for series in data['series'].values():
+            self.assertEqual(len(series), 8)
+            self.assertEqual(series[0][0], (today - timedelta(days=29)).isoformat())
+            self.assertEqual(series[-1][0], today.isoformat())
+
+        data = self.client.get(path, {'max_points': 50}).json()
+        self.assertEqual([len(series) for series in data['series'].values()], [30, 30, 30])
+
+    def test_invalid_max_points(self):
+        make_patients(1, days=1, meds=0)
+        patient = Patient.objects.get()
+        for max_points in ('abc', '2.5', '2', '0', '-5'):
+            response = self.client.get(f'/api/patients/{patient.id}/records', {'max_points': max_points})
+            self.assertEqual(response.status_code, 400, max_points)
+
+    def test_cached_history_is_not_served_for_max_points(self):
+        caches[PATIENT_JSON_CACHE].clear()
+        cache_stats.reset()
+        make_patients(1, days=10, meds=0)
+        patient = Patient.objects.get()
+        path = f'/api/patients/{patient.id}/records'
+        full = self.client.get(path).json()
+
+        small = self.client.get(path, {'max_points': 3}).json()
+        large = self.client.get(path, {'max_points': 5}).json()
+        self.assertEqual(len(full), 10)
+        self.assertEqual((len(small['series']['weight']), len(large['series']['weight'])), (3, 5))
+        # Only the full history went through the cache
+        self.assertEqual(cache_stats.snapshot(), {'records': {'hit': 0, 'miss': 1}})
+        self.assertEqual(self.client.get(path).json(), full)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_counts_queries(self):
+        make_patients(1)
+        patient = Patient.objects.get()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/patients/{patient.id}/records')
+
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+        self.assertRegex(timing, r'json;dur=[\d.]+, view;dur=[\d.]+')
+
+    def test_metrics_endpoint_reports_quantiles_per_url_name(self):
+        for _ in range(3):
+            self.client.get('/api/patients')
+        body = self.client.get('/api/_metrics').content.decode()
+
+        self.assertIn('api_request_duration_seconds{view="patient_list",quantile="0.99"}', body)
+        self.assertIn('api_request_duration_seconds_count{view="patient_list"} 3', body)
+
+    def test_request_log_line_carries_the_timings_as_fields(self):
+        with self.assertLogs('api.metrics', 'INFO') as logs:
+            self.client.get('/api/patients')
+
+        entry = json.loads(JsonLogFormatter().format(logs.records[0]))
+        self.assertEqual((entry['logger'], entry['view'], entry['status']), ('api.metrics', 'patient_list', 200))
+        self.assertTrue({'duration_ms', 'db_ms', 'queries', 'json_ms'} <= set(entry))
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(APITestCase):
+    # Scans that are inherent to what the endpoint returns, keyed by URL name
+    ALLOWED_SCANS = {
+        # First page walks the primary key downwards and stops at the limit
+        'patient_list': {'patient'},
+        # Progress counts every dose; totals count every patient and the
+        # pending-health list stops after ten rows
+        'dashboard': {'medication', 'patient'},
+        # The facility-wide report lists every patient by definition
+        'reports_data': {'patient'},
+        # Full-text lookups go through the FTS5 virtual table's own index
+        'patient_search': {'patient_fts'},
+        # The one-row sequence head
+        'sync': {'sync_sequence'},
+    }
+
+    def endpoint_calls(self):
+        today = date.today().isoformat()
+        month_ago = (date.today() - timedelta(days=30)).isoformat()
+        report = {'from_date': month_ago, 'to_date': today}
+        return [
+            ('get', '/api/patients', {'limit': 2}),
+            ('get', '/api/patients', {'limit': 2, 'after_id': 3}),
+            ('get', '/api/patients/search', {'q': 'pati'}),
+            ('get', '/api/patients/1', None),
+            ('get', '/api/patients/1/records', None),
+            ('get', '/api/patients/1/medicines', None),
+            ('get', '/api/patients/1/trends', {'granularity': 'month'}),
+            ('get', '/api/dashboard', None),
+            ('get', '/api/calendar/events', {'patient_id': 1}),
+            ('get', '/api/reports', report),
+            ('get', '/api/reports', {**report, 'patient_id': 2}),
+            ('get', '/api/reports', {**report, 'format': 'csv'}),
+            ('get', '/api/sync', None),
+            ('get', '/api/sync', {'since': 'djEuMQ'}),
+            ('patch', '/api/medications/mark_given/1', None),
+            ('post', '/api/medications/mark_given', {'patient_id': 1, 'timing': 'morning'}),
+            ('post', '/api/daily/record', {'patient_id': 1, 'bp': '120/80'}),
+            ('post', '/api/daily/records/bulk', [{'patient_id': 1, 'bp': '120/80'}]),
+        ]
+
+    def call(self, method, path, data):
+        if method == 'get':
+            response = self.client.get(path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+        return getattr(self.client, method)(path, json.dumps(data), content_type='application/json')
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[3] for row in cursor.fetchall()]
+
+    def test_endpoint_queries_avoid_table_scans(self):
+        make_patients(5)
+        for method, path, data in self.endpoint_calls():
+            url_name = resolve(path).url_name
+            with self.subTest(path=path, params=data):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.call(method, path, data)
+                self.assertLess(response.status_code, 400)
+
+                allowed = self.ALLOWED_SCANS.get(url_name, set())
+                for query in ctx.captured_queries:
+                    if query['sql'].startswith(('SAVEPOINT', 'RELEASE')):
+                        continue
+                    for step in self.query_plan(query['sql']):
+                        match = re.match(r'SCAN (\w+)', step)
+                        if match and match.group(1) not in allowed:
+                            self.fail(f"{url_name} scans {match.group(1)}: {step}\n{query['sql']}")
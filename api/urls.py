@@ -3,13 +3,19 @@ from . import views
 
 urlpatterns = [
     path('patients', views.patient_list, name='patient_list'),
+    path('patients/search', views.patient_search, name='patient_search'),
     path('patients/<int:patient_id>', views.patient_detail, name='patient_detail'),
     path('patients/<int:patient_id>/records', views.patient_records, name='patient_records'),
     path('patients/<int:patient_id>/medicines', views.patient_medicines, name='patient_medicines'),
+    path('patients/<int:patient_id>/trends', views.patient_trends, name='patient_trends'),
+    path('medications/mark_given', views.mark_medications_given, name='mark_medications_given'),
     path('medications/mark_given/<int:med_id>', views.mark_medication_given, name='mark_medication_given'),
     path('daily/record', views.daily_record, name='daily_record'),
+    path('daily/records/bulk', views.daily_records_bulk, name='daily_records_bulk'),
     path('dashboard', views.dashboard, name='dashboard'),
     path('calendar/events', views.calendar_events, name='calendar_events'),
     path('calendar/events/<str:event_id>/complete', views.complete_event, name='complete_event'),
     path('reports', views.reports_data, name='reports_data'),
+    path('sync', views.sync, name='sync'),
+    path('_metrics', views.metrics, name='metrics'),
 ]
@@ -1,95 +1,434 @@
+import asyncio
+import csv
 import json
-from datetime import date, datetime, timedelta
-from django.http import JsonResponse
+import math
+from itertools import groupby, islice
+from operator import itemgetter
+from datetime import date, datetime, time, timedelta
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.db import transaction
 from django.db.models import Count, Q
-from .models import Patient, Medication, DailyRecord
+from .models import Patient, Medication, MedicationAdministration, DailyRecord, SyncTombstone, VitalsRollup
+from .cache import aget_dashboard_snapshot, aget_patient_json, invalidate_dashboard
+from .facilities import (
+    afan_out, all_facilities, current_database, current_facility, facilities, fans_out, iterate_in_context,
+    iterate_in_facility, reads_from_replica
+)
+from .metrics import JsonResponse, cache_stats, registry
+from .downsample import lttb
+from .schedule import course_window, days_between, expand_events, parse_event_id
+from .sync import RESOURCE_BY_TABLE, SYNC_RESOURCES, current_sequence, decode_cursor, encode_cursor
+from .serializers import (
+    DailyRecordSerializer, MedicationSerializer, PatientSerializer, PendingMedicationSerializer, bp_display
+)
+
+PATIENT_LIST_FIELDS = ['id', 'name', 'age', 'gender', 'chief_complaint']
+PATIENT_LIST_FIELD_CHOICES = list(PatientSerializer.fields)
+PATIENT_PAGE_SIZE = 50
+PATIENT_PAGE_MAX = 500
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+async def _aiter_sync(iterator, batch_size=100):
+    """
+    Serve a synchronous (DB-backed) iterator from async code a batch at a time,
+    so streaming responses stay incremental under ASGI.
+    """
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    while batch := await next_batch():
+        for item in batch:
+            yield item
+
+def _streaming_content(request, iterator):
+    # Each handler must get the iterator flavour it can stream without
+    # buffering: async under ASGI, the plain generator under WSGI. Either
+    # way the body runs after the view returns, in the request's context.
+    iterator = iterate_in_context(iterator)
+    return _aiter_sync(iterator) if isinstance(request, ASGIRequest) else iterator
 
 @csrf_exempt
-def patient_list(request):
+@reads_from_replica
+async def patient_list(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            patient = Patient.objects.create(
+            patient = await Patient.objects.acreate(
                 name=data['name'],
                 age=data['age'],
                 gender=data['gender'],
                 chief_complaint=data.get('chief_complaint')
             )
+            await sync_to_async(invalidate_dashboard)()
             return JsonResponse({"message": "Patient added successfully", "id": patient.id}, status=201)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
     
     elif request.method == 'GET':
-        patients = Patient.objects.all().order_by('-id')
-        data = [{
-            "id": p.id,
-            "name": p.name,
-            "age": p.age,
-            "gender": p.gender,
-            "chief_complaint": p.chief_complaint
-        } for p in patients]
-        return JsonResponse(data, safe=False)
-
-def patient_detail(request, patient_id):
-    try:
-        patient = get_object_or_404(Patient, id=patient_id)
+        # Optional ?fields= projection, e.g. fields=name,age (id is always included)
+        fields = PATIENT_LIST_FIELDS
+        if request.GET.get('fields'):
+            requested = [f.strip() for f in request.GET['fields'].split(',') if f.strip()]
+            unknown = set(requested) - set(PATIENT_LIST_FIELD_CHOICES)
+            if unknown:
+                return JsonResponse({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400)
+            fields = ['id'] + [f for f in requested if f != 'id']
+
+        serializer = PatientSerializer(*fields)
+        patients = Patient.objects.order_by('-id')
+
+        # Without a cursor or limit keep returning the whole roster as a plain array
+        if 'after_id' not in request.GET and 'limit' not in request.GET:
+            return JsonResponse(await serializer.aserialize(patients), safe=False)
+
+        # Keyset pagination: walk the primary key downwards from ?after_id=
+        try:
+            limit = min(int(request.GET.get('limit', PATIENT_PAGE_SIZE)), PATIENT_PAGE_MAX)
+            after_id = int(request.GET['after_id']) if request.GET.get('after_id') else None
+        except ValueError:
+            return JsonResponse({"error": "after_id and limit must be integers"}, status=400)
+        if limit < 1:
+            return JsonResponse({"error": "limit must be positive"}, status=400)
+
+        if after_id is not None:
+            patients = patients.filter(id__lt=after_id)
+        # Fetch one extra row to learn whether another page exists
+        page = await serializer.aserialize(patients[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
         return JsonResponse({
-            "id": patient.id,
-            "name": patient.name,
-            "age": patient.age,
-            "gender": patient.gender,
-            "chief_complaint": patient.chief_complaint,
-            "date_of_joining": patient.date_of_joining.isoformat() if patient.date_of_joining else None
+            "results": page,
+            "next": page[-1]['id'] if has_more else None
         })
+
+PATIENT_SEARCH_LIMIT = 20
+PATIENT_SEARCH_MAX = 100
+PATIENT_SEARCH = PatientSerializer(*PATIENT_LIST_FIELDS)
+
+async def patient_search(request):
+    """
+    Full-text patient search on name and chief complaint, best match first.
+    Query params: q (each word matches as a prefix), limit (default 20)
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({"error": "q is required"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', PATIENT_SEARCH_LIMIT)), PATIENT_SEARCH_MAX)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "limit must be positive"}, status=400)
+
+    try:
+        ids = await sync_to_async(Patient.search)(query, limit)
+        rows = await PATIENT_SEARCH.aserialize(Patient.objects.filter(id__in=ids))
+        by_id = {row['id']: row for row in rows}
+        return JsonResponse([by_id[i] for i in ids if i in by_id], safe=False)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+async def _patient_validators(patient_id, resource, day=None):
+    """
+    Strong ETag and Last-Modified for one of a patient's resources, from the
+    patient's data version (one primary-key lookup). None if no such patient.
+    Resources derived from "today" also vary by `day`.
+    """
+    row = await Patient.objects.filter(id=patient_id).values_list('version', 'last_modified').afirst()
+    if row is None:
+        return None
+    version, last_modified = row
+    tag = f"{resource}-{patient_id}-{version}"
+    if day:
+        tag += f"-{day.isoformat()}"
+        last_modified = max(last_modified, timezone.make_aware(datetime.combine(day, time.min)))
+    return quote_etag(tag), last_modified
+
+def _not_modified(request, validators):
+    """The 304 response if the request's preconditions match, else None."""
+    if validators is None:
+        return None
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    return _with_validators(response, validators) if response is not None else None
+
+def _with_validators(response, validators):
+    if validators is not None:
+        response['ETag'] = validators[0]
+        response['Last-Modified'] = http_date(validators[1].timestamp())
+    return response
+
+PATIENT_DETAIL = PatientSerializer()
+
+async def patient_detail(request, patient_id):
+    try:
+        validators = await _patient_validators(patient_id, 'patient')
+        if not_modified := _not_modified(request, validators):
+            return not_modified
+        row = await PATIENT_DETAIL.rows(Patient.objects.filter(id=patient_id)).afirst()
+        if row is None:
+            raise Http404("No Patient matches the given query.")
+        return _with_validators(JsonResponse(PATIENT_DETAIL.to_dict(row)), validators)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=404)
 
-def patient_records(request, patient_id):
+DOWNSAMPLE_SERIES = {'weight': 'weight', 'bp_systolic': 'bp_systolic', 'bp_diastolic': 'bp_diastolic'}
+
+async def _downsampled_records(records, max_points):
+    """
+    Bounded-size chart series: each vitals series reduced to at most
+    `max_points` points with LTTB, built in one pass over the range's values.
+    """
+    series = {name: [] for name in DOWNSAMPLE_SERIES}
+    total = 0
+    rows = records.order_by('date').values_list('date', *DOWNSAMPLE_SERIES.values())
+    async for day, *values in rows:
+        total += 1
+        x = day.toordinal()
+        for name, value in zip(DOWNSAMPLE_SERIES, values):
+            if value is not None:
+                series[name].append((x, value))
+    return {
+        "max_points": max_points,
+        "total_records": total,
+        "series": {
+            name: [[date.fromordinal(x).isoformat(), y] for x, y in lttb(points, max_points)]
+            for name, points in series.items()
+        }
+    }
+
+DAILY_RECORD = DailyRecordSerializer()
+
+async def patient_records(request, patient_id):
+    """
+    Query params (optional): from_date, to_date, max_points (>= 3) to get
+    LTTB-downsampled weight/BP series instead of every daily row.
+    """
+    try:
+        try:
+            max_points = int(request.GET['max_points']) if request.GET.get('max_points') else None
+            from_date = date.fromisoformat(request.GET['from_date']) if request.GET.get('from_date') else None
+            to_date = date.fromisoformat(request.GET['to_date']) if request.GET.get('to_date') else None
+        except ValueError:
+            return JsonResponse({"error": "max_points must be an integer and dates YYYY-MM-DD"}, status=400)
+        if max_points is not None and max_points < 3:
+            return JsonResponse({"error": "max_points must be at least 3"}, status=400)
+
+        validators = await _patient_validators(patient_id, 'records')
+        if not_modified := _not_modified(request, validators):
+            return not_modified
+
+        records = DailyRecord.objects.filter(patient_id=patient_id)
+        if from_date:
+            records = records.filter(date__gte=from_date)
+        if to_date:
+            records = records.filter(date__lte=to_date)
+
+        if max_points is not None:
+            data = await _downsampled_records(records, max_points)
+            return _with_validators(JsonResponse({"patient_id": patient_id, **data}), validators)
+
+        if from_date or to_date:
+            records = await DAILY_RECORD.aserialize(records.order_by('-date'))
+            return _with_validators(JsonResponse(records, safe=False), validators)
+
+        if validators is None:
+            # No such patient: nothing to cache, and nothing to list
+            return JsonResponse([], safe=False)
+
+        # The full history is the common case and is served from the cache
+        async def abuild():
+            return JsonResponse(await DAILY_RECORD.aserialize(records.order_by('-date')), safe=False).content
+        body = await aget_patient_json('records', validators[0], abuild)
+        return _with_validators(HttpResponse(body, content_type='application/json'), validators)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+PATIENT_MEDICINE = MedicationSerializer(
+    'id', 'name', 'dose', 'timing', 'timing_display', 'type', 'food_relation', 'is_given_today'
+)
+
+async def patient_medicines(request, patient_id):
     try:
-        records = DailyRecord.objects.filter(patient_id=patient_id).order_by('-date')
-        return JsonResponse([record.to_dict() for record in records], safe=False)
+        today = date.today()
+        # "is_given_today" flips at midnight without any write, hence the day
+        validators = await _patient_validators(patient_id, 'medicines', day=today)
+        if not_modified := _not_modified(request, validators):
+            return not_modified
+        if validators is None:
+            return JsonResponse([], safe=False)
+
+        async def abuild():
+            meds = Medication.objects.filter(patient_id=patient_id).with_given_on(today)
+            return JsonResponse(await PATIENT_MEDICINE.aserialize(meds), safe=False).content
+        body = await aget_patient_json('medicines', validators[0], abuild)
+        return _with_validators(HttpResponse(body, content_type='application/json'), validators)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-def patient_medicines(request, patient_id):
+TRENDS_DEFAULT_DAYS = 90
+
+async def patient_trends(request, patient_id):
+    """
+    Weekly or monthly vitals aggregates from the rollup table.
+    Query params: granularity (week (default) or month), from_date, to_date
+    (default: the last 90 days)
+    """
     try:
-        meds = Medication.objects.filter(patient_id=patient_id)
-        meds_data = []
-        for med in meds:
-            timing_display = med.timing.capitalize() if med.timing else "Any time"
-            if med.food_relation:
-                food_text = "Before Food" if med.food_relation == "before_food" else "After Food"
-                timing_display += f" • {food_text}"
-            
-            meds_data.append({
-                "id": med.id,
-                "name": med.name,
-                "dose": med.dose,
-                "timing": med.timing,
-                "timing_display": timing_display,
-                "type": med.type,
-                "food_relation": med.food_relation,
-                "is_given_today": med.is_given_today
-            })
-        return JsonResponse(meds_data, safe=False)
+        granularity = request.GET.get('granularity', 'week')
+        if granularity not in VitalsRollup.GRANULARITIES:
+            return JsonResponse({"error": "granularity must be week or month"}, status=400)
+        try:
+            to_date = date.fromisoformat(request.GET['to_date']) if request.GET.get('to_date') else date.today()
+            from_date = (
+                date.fromisoformat(request.GET['from_date']) if request.GET.get('from_date')
+                else to_date - timedelta(days=TRENDS_DEFAULT_DAYS)
+            )
+        except ValueError:
+            return JsonResponse({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+
+        # A defaulted window moves with the date, so the ETag must too
+        validators = await _patient_validators(
+            patient_id, 'trends', day=None if request.GET.get('to_date') else to_date
+        )
+        if not_modified := _not_modified(request, validators):
+            return not_modified
+
+        # Include the bucket that contains from_date
+        first_period = VitalsRollup.period_bounds(granularity, from_date)[0]
+        rollups = VitalsRollup.objects.filter(
+            patient_id=patient_id,
+            granularity=granularity,
+            period_start__gte=first_period,
+            period_start__lte=to_date
+        ).order_by('period_start')
+
+        buckets = []
+        async for rollup in rollups:
+            bucket = {"period_start": rollup.period_start.isoformat(), "records": rollup.record_count}
+            for metric in VitalsRollup.METRICS:
+                mean = getattr(rollup, f'{metric}_mean')
+                bucket[metric] = {
+                    "min": getattr(rollup, f'{metric}_min'),
+                    "max": getattr(rollup, f'{metric}_max'),
+                    "mean": round(mean, 1) if mean is not None else None,
+                    "count": getattr(rollup, f'{metric}_count')
+                }
+            buckets.append(bucket)
+
+        return _with_validators(JsonResponse({
+            "patient_id": patient_id,
+            "granularity": granularity,
+            "from_date": from_date.isoformat(),
+            "to_date": to_date.isoformat(),
+            "buckets": buckets
+        }), validators)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+def _mark_given(medications, day):
+    """Log the dose on `day` for every medication in the queryset; return the newly marked ids."""
+    given_at = timezone.now()
+    with transaction.atomic(using=current_database()):
+        marked = MedicationAdministration.record_doses(medications, day, given_at)
+        if marked and day == date.today():
+            # Keep the legacy flags in step with the log in the same transaction
+            Medication.objects.filter(id__in=marked).update(is_given_today=True, given_at=given_at)
+    if marked:
+        invalidate_dashboard()
+    return marked
+
 @csrf_exempt
 def mark_medication_given(request, med_id):
     if request.method == 'PATCH':
-        med = get_object_or_404(Medication, id=med_id)
-        if med.is_given_today:
-            return JsonResponse({"message": "Already marked as given"}, status=200)
-        
-        med.is_given_today = True
-        med.given_at = datetime.now()
-        med.save()
-        return JsonResponse({"message": "Marked as given successfully"}, status=200)
+        # No read-modify-write: the insert itself decides who marks the dose
+        if _mark_given(Medication.objects.filter(id=med_id), date.today()):
+            return JsonResponse({"message": "Marked as given successfully"}, status=200)
+        if not Medication.objects.filter(id=med_id).exists():
+            return JsonResponse({"error": "Medication not found"}, status=404)
+        return JsonResponse({"message": "Already marked as given"}, status=200)
     return JsonResponse({"error": "Method not allowed"}, status=405)
 
+@csrf_exempt
+def mark_medications_given(request):
+    """
+    Mark many doses as given in one statement.
+    Body: {"medication_ids": [...]} or {"patient_id": X, "timing": "morning"?}
+    (the latter marks every medication of patient X due at that timing).
+    """
+    if request.method not in ('POST', 'PATCH'):
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Expected a JSON object"}, status=400)
+
+    try:
+        medication_ids = data.get('medication_ids')
+        if medication_ids is not None:
+            if not isinstance(medication_ids, list) or not all(isinstance(i, int) for i in medication_ids):
+                return JsonResponse({"error": "medication_ids must be a list of integers"}, status=400)
+            medications = Medication.objects.filter(id__in=medication_ids)
+        elif data.get('patient_id'):
+            medications = Medication.objects.filter(patient_id=data['patient_id'])
+            if data.get('timing'):
+                medications = medications.filter(timing=data['timing'])
+        else:
+            return JsonResponse({"error": "medication_ids or patient_id required"}, status=400)
+
+        today = date.today()
+        marked = _mark_given(medications, today)
+        given = set(MedicationAdministration.objects.filter(
+            date=today, medication__in=medications
+        ).values_list('medication_id', flat=True))
+
+        result = {
+            "marked": sorted(marked),
+            "already_given": sorted(given - marked)
+        }
+        if medication_ids is not None:
+            result["not_found"] = sorted(set(medication_ids) - given)
+        return JsonResponse(result, status=200)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+def _parse_bp(bp_input):
+    """Split a "120/80" or "120" reading into (systolic, diastolic, display string)."""
+    bp_systolic = None
+    bp_diastolic = None
+    bp_string = None
+
+    if bp_input:
+        if '/' in str(bp_input):
+            parts = str(bp_input).split('/')
+            bp_systolic = int(parts[0]) if len(parts) > 0 and parts[0].isdigit() else None
+            bp_diastolic = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            bp_string = str(bp_input)
+        else:
+            bp_systolic = int(bp_input) if str(bp_input).isdigit() else None
+            bp_string = str(bp_input)
+    return bp_systolic, bp_diastolic, bp_string
+
+def _parse_weight(weight):
+    """A weight as a float, or None if omitted; ValueError unless a finite number."""
+    if isinstance(weight, bool):
+        raise ValueError
+    weight = float(weight) if weight else None
+    # float() accepts "nan", "inf" and overflowing "1e400"
+    if weight is not None and not math.isfinite(weight):
+        raise ValueError
+    return weight
+
 @csrf_exempt
 def daily_record(request):
     if request.method == 'POST':
@@ -109,195 +448,489 @@ def daily_record(request):
             except ValueError:
                 return JsonResponse({"error": "Invalid date format"}, status=400)
 
-            bp_systolic = None
-            bp_diastolic = None
-            bp_string = None
-
-            if bp_input:
-                if '/' in str(bp_input):
-                    parts = str(bp_input).split('/')
-                    bp_systolic = int(parts[0]) if len(parts) > 0 and parts[0].isdigit() else None
-                    bp_diastolic = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
-                    bp_string = str(bp_input)
-                else:
-                    bp_systolic = int(bp_input) if str(bp_input).isdigit() else None
-                    bp_string = str(bp_input)
-
-            record, created = DailyRecord.objects.update_or_create(
-                patient_id=patient_id,
-                date=selected_date,
-                defaults={
-                    'weight': float(weight) if weight else None,
-                    'bp': bp_string,
-                    'bp_systolic': bp_systolic,
-                    'bp_diastolic': bp_diastolic,
-                    'notes': notes
-                }
-            )
-            
-            # If update_or_create didn't use the defaults for existing record (it only uses them for update if not created? No, it updates)
-            # Actually update_or_create updates with defaults.
-            # But we need to handle the case where weight is None in input but we want to keep existing?
-            # Flask code: existing.weight = float(weight) if weight else existing.weight
-            # update_or_create replaces. So we might need to fetch first.
-            
-            # Let's rewrite to match Flask logic exactly
-            existing = DailyRecord.objects.filter(patient_id=patient_id, date=selected_date).first()
-            if existing:
-                if weight: existing.weight = float(weight)
-                existing.bp = bp_string
-                existing.bp_systolic = bp_systolic
-                existing.bp_diastolic = bp_diastolic
-                existing.notes = notes
-                existing.save()
-                record = existing
-            else:
-                record = DailyRecord.objects.create(
+            try:
+                weight = _parse_weight(weight)
+            except (TypeError, ValueError):
+                return JsonResponse({"error": "Invalid weight"}, status=400)
+
+            bp_systolic, bp_diastolic, bp_string = _parse_bp(bp_input)
+
+            with transaction.atomic(using=current_database()):
+                # One INSERT ... ON CONFLICT statement; an omitted weight keeps the stored one
+                record = DailyRecord.upsert(
                     patient_id=patient_id,
                     date=selected_date,
-                    weight=float(weight) if weight else None,
+                    weight=weight,
                     bp=bp_string,
                     bp_systolic=bp_systolic,
                     bp_diastolic=bp_diastolic,
                     notes=notes
                 )
+                VitalsRollup.refresh([record.patient_id], [selected_date])
 
+            invalidate_dashboard()
             return JsonResponse({
                 "message": "Health record saved successfully",
-                "data": record.to_dict()
+                "data": DAILY_RECORD.from_instance(record)
             }, status=200)
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     return JsonResponse({"error": "Method not allowed"}, status=405)
 
-def dashboard(request):
+DAILY_RECORDS_BULK_MAX = 10000
+DAILY_RECORDS_BATCH_SIZE = 500
+# Longest bp text the column holds, and the largest plausible reading
+BP_MAX_LENGTH = DailyRecord._meta.get_field('bp').max_length
+BP_MAX_READING = 999
+
+@csrf_exempt
+def daily_records_bulk(request):
+    """
+    Upsert many vitals entries in one transaction.
+    Body: [{"patient_id", "date"?, "weight"?, "bp"?, "notes"?}, ...]
+    Every entry is validated first; if any fails nothing is written.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        entries = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({"error": "Expected a non-empty array of records"}, status=400)
+    if len(entries) > DAILY_RECORDS_BULK_MAX:
+        return JsonResponse({"error": f"At most {DAILY_RECORDS_BULK_MAX} records per request"}, status=400)
+
     try:
-        today = date.today()
-        total_meds = Medication.objects.count()
-        given_meds = Medication.objects.filter(is_given_today=True).count()
-        pending_meds = Medication.objects.filter(is_given_today=False)
-
-        pending_med_list = []
-        for med in pending_meds:
-            # Build timing string
-            timing_text = med.timing.capitalize() if med.timing else "Any time"
-            if med.food_relation:
-                food_text = "Before Food" if med.food_relation == "before_food" else "After Food"
-                timing_text += f" • {food_text}"
-
-            pending_med_list.append({
-                "medication_id": med.id,
-                "patient_name": med.patient.name,
-                "medicine_name": med.name,
-                "dose": med.dose,
-                "timing_display": timing_text,
-                "type": med.type,
-                "timing": med.timing,
-                "food_relation": med.food_relation
-            })
-
-        # Pending health updates
-        recorded_today_patient_ids = DailyRecord.objects.filter(date=today).values_list('patient_id', flat=True)
-        pending_patients = Patient.objects.exclude(id__in=recorded_today_patient_ids)[:10]
-
-        pending_health = [
-            {"id": p.id, "name": p.name, "age": p.age, "gender": p.gender}
-            for p in pending_patients
-        ]
+        # Validate everything up front; one query checks all patient ids
+        patient_ids = {
+            int(entry['patient_id']) for entry in entries
+            if isinstance(entry, dict) and str(entry.get('patient_id')).isdigit()
+        }
+        known_patients = set(Patient.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+
+        results = []
+        records = {}
+        today = date.today().isoformat()
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                results.append({"index": index, "error": "Record must be an object"})
+                continue
+            patient_id = entry.get('patient_id')
+            if not patient_id:
+                results.append({"index": index, "error": "patient_id required"})
+                continue
+            if not str(patient_id).isdigit() or int(patient_id) not in known_patients:
+                results.append({"index": index, "error": "Patient not found"})
+                continue
+            try:
+                selected_date = date.fromisoformat(entry.get('date', today))
+            except (TypeError, ValueError):
+                results.append({"index": index, "error": "Invalid date format"})
+                continue
+            weight = entry.get('weight')
+            try:
+                weight = _parse_weight(weight)
+            except (TypeError, ValueError):
+                results.append({"index": index, "error": "Invalid weight"})
+                continue
+            notes = entry.get('notes')
+            if notes is not None and not isinstance(notes, str):
+                results.append({"index": index, "error": "notes must be a string"})
+                continue
+
+            bp = entry.get('bp')
+            if isinstance(bp, (bool, dict, list)) or len(str(bp or '')) > BP_MAX_LENGTH:
+                results.append({"index": index, "error": "Invalid bp"})
+                continue
+            bp_systolic, bp_diastolic, bp_string = _parse_bp(bp)
+            if max(bp_systolic or 0, bp_diastolic or 0) > BP_MAX_READING:
+                results.append({"index": index, "error": "Invalid bp"})
+                continue
+            key = (int(patient_id), selected_date)
+            # Repeated patient/date pairs apply in order, like sequential single posts
+            if weight is None and key in records:
+                weight = records[key].weight
+            records[key] = DailyRecord(
+                patient_id=key[0],
+                date=selected_date,
+                weight=weight,
+                bp=bp_string,
+                bp_systolic=bp_systolic,
+                bp_diastolic=bp_diastolic,
+                notes=notes
+            )
+            results.append({"index": index, "patient_id": key[0], "date": selected_date.isoformat()})
+
+        if any('error' in result for result in results):
+            return JsonResponse({"error": "Validation failed", "results": results}, status=400)
+
+        # Rows without a weight must not overwrite the stored one, so they get
+        # their own upsert that leaves the weight column alone.
+        update_fields = ['bp', 'bp_systolic', 'bp_diastolic', 'notes']
+        with_weight = [record for record in records.values() if record.weight is not None]
+        without_weight = [record for record in records.values() if record.weight is None]
+        with transaction.atomic(using=current_database()):
+            for batch, fields in ((with_weight, update_fields + ['weight']), (without_weight, update_fields)):
+                if batch:
+                    DailyRecord.objects.bulk_create(
+                        batch,
+                        batch_size=DAILY_RECORDS_BATCH_SIZE,
+                        update_conflicts=True,
+                        unique_fields=['patient', 'date'],
+                        update_fields=fields
+                    )
+            VitalsRollup.refresh({key[0] for key in records}, {key[1] for key in records})
 
+        for result in results:
+            record = records[(result['patient_id'], date.fromisoformat(result['date']))]
+            result['id'] = record.id
+
+        invalidate_dashboard()
         return JsonResponse({
-            "medication_progress": {
-                "given": given_meds,
-                "total": total_meds,
-                "percentage": round((given_meds / total_meds * 100), 1) if total_meds else 0
-            },
-            "pending_medications": pending_med_list,
-            "pending_health_updates": pending_health,
-            "total_patients": Patient.objects.count()
-        })
+            "message": f"{len(records)} health records saved successfully",
+            "results": results
+        }, status=200)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+PENDING_MEDICATION = PendingMedicationSerializer()
+PENDING_HEALTH_LIMIT = 10
+
+async def _abuild_dashboard(today):
+    # Both progress counters come from one aggregate over Medication, with
+    # "given" resolved against today's slice of the administration log.
+    meds = Medication.objects.with_given_on(today)
+
+    # Join the patient name in the same query instead of one lookup per dose.
+    pending_meds = PENDING_MEDICATION.rows(meds.filter(given_today=False).order_by('id'))
+
+    # Pending health updates (the recorded-today ids stay a subquery)
+    recorded_today_patient_ids = DailyRecord.objects.filter(date=today).values('patient_id')
+    pending_patients = (
+        Patient.objects.exclude(id__in=recorded_today_patient_ids)
+        .values('id', 'name', 'age', 'gender')[:PENDING_HEALTH_LIMIT]
+    )
+
+    # The four queries are independent, so issue them together
+    progress, pending_meds, pending_health, total_patients = await asyncio.gather(
+        meds.aaggregate(
+            total=Count('id'),
+            given=Count('id', filter=Q(given_today=True)),
+        ),
+        _alist(pending_meds),
+        _alist(pending_patients),
+        Patient.objects.acount(),
+    )
+    total_meds = progress['total']
+    given_meds = progress['given']
+
+    pending_med_list = [PENDING_MEDICATION.to_dict(row) for row in pending_meds]
+
+    return {
+        "medication_progress": {
+            "given": given_meds,
+            "total": total_meds,
+            "percentage": round((given_meds / total_meds * 100), 1) if total_meds else 0
+        },
+        "pending_medications": pending_med_list,
+        "pending_health_updates": pending_health,
+        "total_patients": total_patients
+    }
+
+def _facility_dashboard(today):
+    # Runs on a fan-out thread, which has no event loop of its own
+    return async_to_sync(aget_dashboard_snapshot)(_abuild_dashboard, today)
+
+def _merge_dashboards(snapshots):
+    """One dashboard over every facility; list entries name their facility."""
+    given_meds = sum(snapshot['medication_progress']['given'] for snapshot in snapshots.values())
+    total_meds = sum(snapshot['medication_progress']['total'] for snapshot in snapshots.values())
+    return {
+        "medication_progress": {
+            "given": given_meds,
+            "total": total_meds,
+            "percentage": round((given_meds / total_meds * 100), 1) if total_meds else 0
+        },
+        "pending_medications": [
+            {**med, "facility": facility}
+            for facility, snapshot in snapshots.items() for med in snapshot['pending_medications']
+        ],
+        "pending_health_updates": [
+            {**patient, "facility": facility}
+            for facility, snapshot in snapshots.items() for patient in snapshot['pending_health_updates']
+        ][:PENDING_HEALTH_LIMIT],
+        "total_patients": sum(snapshot['total_patients'] for snapshot in snapshots.values())
+    }
+
+@all_facilities
+@reads_from_replica
+async def dashboard(request):
+    """The selected facility's dashboard, or (without X-Facility) every facility's merged."""
+    try:
+        if fans_out():
+            return JsonResponse(_merge_dashboards(await afan_out(_facility_dashboard, date.today())))
+        return JsonResponse(await aget_dashboard_snapshot(_abuild_dashboard))
     except Exception as e:
         return JsonResponse({"error": "Server error", "details": str(e)}, status=500)
 
+CALENDAR_MAX_DAYS = 92
+
 def calendar_events(request):
+    """
+    Medication doses and daily health updates due in a window.
+    Query params: start, end (YYYY-MM-DD, default today), patient_id (optional)
+    """
     try:
-        today = date.today()
-        events = []
-        
-        # Assuming Medicine in Flask was Medication? Flask code imported Medicine but model was Medication.
-        # Wait, Flask code in calendar.py imported Medicine. But models.py has Medication.
-        # Let's assume Medicine == Medication.
-        
-        # In Flask calendar.py: Medicine.start_date. 
-        # But Medication model in Flask models.py DOES NOT HAVE start_date or duration_days!
-        # It seems Flask calendar.py was using a different model or I missed something.
-        # Let's re-read Flask models.py carefully.
-        
-        # Flask models.py:
-        # class Medication(db.Model):
-        #     ...
-        #     is_given_today = db.Column(db.Boolean, default=False)
-        #     given_at = db.Column(db.DateTime)
-        
-        # Flask calendar.py:
-        # from models import db, Medicine, PatientRecord, Appointment
-        
-        # It seems calendar.py was importing models that DO NOT EXIST in the provided models.py!
-        # The user said "copy the exact thing".
-        # If the Flask app was working, models.py must have had those classes or they were imported from elsewhere.
-        # But I only saw one models.py.
-        
-        # Let's look at the file list of ElderEase_Backend again.
-        # models.py size 2550 bytes.
-        
-        # If I cannot find Medicine/PatientRecord/Appointment, I cannot implement calendar exactly as is.
-        # However, I should implement what I can based on Medication/Patient/DailyRecord.
-        
-        # Let's map:
-        # Medicine -> Medication (but missing start_date, duration_days)
-        # PatientRecord -> DailyRecord
-        
-        # Since I can't invent fields, I will comment out the missing parts or adapt.
-        # But wait, the user wants "exact clone".
-        # Maybe I should check if there are other model files? No, only models.py.
-        
-        # I will implement a basic version of calendar events based on available data.
-        # Or maybe I should ask the user? No, "exact clone".
-        # I will assume the provided models.py is the source of truth and the calendar.py might be stale or broken code in the source.
-        # I will comment out the broken parts in the new implementation with a note.
-        
-        # Actually, let's look at the Flask calendar.py again.
-        # It imports Medicine, PatientRecord, Appointment.
-        # These are NOT in models.py.
-        # So the Flask app's calendar feature likely wouldn't work if I ran it.
-        # I will implement the endpoint but return empty list or adapt to what we have.
-        
-        # Adapting to what we have:
-        # We have Medication. We can show medications as events?
-        # But we don't have dates for them except is_given_today.
-        
-        # I'll stick to implementing what is possible.
-        
-        return JsonResponse(events, safe=False)
+        try:
+            start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else date.today()
+            end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else start
+        except ValueError:
+            return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
+        if end < start:
+            return JsonResponse({'error': 'end must not be before start'}, status=400)
+        if (end - start).days >= CALENDAR_MAX_DAYS:
+            return JsonResponse({'error': f'Window is limited to {CALENDAR_MAX_DAYS} days'}, status=400)
+
+        patients = Patient.objects.order_by('id')
+        medications = Medication.objects.order_by('id')
+        if request.GET.get('patient_id'):
+            patients = patients.filter(id=request.GET['patient_id'])
+            medications = medications.filter(patient_id=request.GET['patient_id'])
+
+        # Completion state only for the window, straight off the (…, date) indexes
+        given = set(MedicationAdministration.objects.filter(
+            medication__in=medications, date__gte=start, date__lte=end
+        ).values_list('medication_id', 'date'))
+        recorded = set(DailyRecord.objects.filter(
+            patient__in=patients, date__gte=start, date__lte=end
+        ).values_list('patient_id', 'date'))
+
+        events = expand_events(
+            list(medications.values(
+                'id', 'patient_id', 'patient__name', 'patient__date_of_joining', 'name', 'dose',
+                'timing', 'food_relation', 'start_date', 'duration_days'
+            )),
+            list(patients.values('id', 'name', 'date_of_joining')),
+            start, end, given, recorded
+        )
+        return JsonResponse(list(events), safe=False)
 
     except Exception as e:
         return JsonResponse({'error': 'Failed to fetch events'}, status=500)
 
 @csrf_exempt
 def complete_event(request, event_id):
-    # Since we don't have the event logic fully working due to missing models, 
-    # I'll implement a placeholder or try to match the Medication logic if applicable.
-    return JsonResponse({'message': 'Event marked as completed'}, status=200)
+    """Complete a calendar event; medication events log the dose for their day."""
+    if request.method not in ('POST', 'PATCH'):
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        kind, object_id, day = parse_event_id(event_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid event id'}, status=400)
+    if kind == 'vitals':
+        return JsonResponse({'error': 'Health updates are completed by posting to /api/daily/record'}, status=400)
+    if day > date.today():
+        return JsonResponse({'error': 'Cannot complete a future dose'}, status=400)
+
+    medications = Medication.objects.filter(id=object_id)
+    med = medications.values('start_date', 'duration_days', 'patient__date_of_joining').first()
+    if med is None:
+        return JsonResponse({'error': 'Medication not found'}, status=404)
+    # Only days the calendar shows a dose for
+    if course_window(med, day, day) is None:
+        return JsonResponse({'error': 'No dose is scheduled on that day'}, status=400)
+    if _mark_given(medications, day):
+        return JsonResponse({'message': 'Event marked as completed'}, status=200)
+    return JsonResponse({'message': 'Event already completed'}, status=200)
 
-def reports_data(request):
+REPORT_CHUNK_SIZE = 2000
+
+REPORT_CSV_COLUMNS = [
+    'patient_id', 'patient_name', 'record_id', 'date', 'weight',
+    'bp', 'bp_systolic', 'bp_diastolic', 'notes'
+]
+
+class _Echo:
+    """Pseudo-buffer so csv.writer hands back each row instead of storing it."""
+    def write(self, value):
+        return value
+
+def _report_querysets(patient_id, from_date, to_date):
+    # Build query filters
+    patients_query = Patient.objects.all()
+    if patient_id:
+        patients_query = patients_query.filter(id=patient_id)
+    patient_ids = patients_query.values('id')
+
+    # Every stream is ordered by patient so they can be merge-joined in one
+    # pass: four queries in total, however many patients the report covers.
+    patients = patients_query.order_by('id').values(
+        'id', 'name', 'age', 'gender', 'chief_complaint', 'date_of_joining'
+    )
+    medications = Medication.objects.filter(patient_id__in=patient_ids).with_given_on(date.today()).order_by(
+        'patient_id', 'id'
+    ).values(
+        'id', 'patient_id', 'name', 'dose', 'timing', 'type', 'food_relation', 'given_today',
+        'start_date', 'duration_days'
+    )
+    daily_records = DailyRecord.objects.filter(
+        patient_id__in=patient_ids,
+        date__gte=from_date,
+        date__lte=to_date
+    ).order_by('patient_id', 'date').values(
+        'id', 'patient_id', 'date', 'weight', 'bp', 'bp_systolic', 'bp_diastolic', 'notes'
+    )
+    # Range scan on the (patient, date) index of the administration log
+    administrations = MedicationAdministration.objects.filter(
+        patient_id__in=patient_ids,
+        date__gte=from_date,
+        date__lte=to_date
+    ).order_by('patient_id', 'date', 'medication_id').values('patient_id', 'date', 'medication_id')
+    return patients, medications, daily_records, administrations
+
+def _join_by_patient(patients, *children):
+    """
+    Merge-join patient rows with child row streams that are sorted by
+    patient_id, yielding (patient, [children_1, children_2, ...]).
+    Only one patient's children are held in memory at a time.
+    """
+    streams = [groupby(rows, key=itemgetter('patient_id')) for rows in children]
+    heads = [next(stream, None) for stream in streams]
+    for patient in patients:
+        matched = []
+        for i, stream in enumerate(streams):
+            while heads[i] is not None and heads[i][0] < patient['id']:
+                heads[i] = next(stream, None)
+            if heads[i] is not None and heads[i][0] == patient['id']:
+                matched.append(list(heads[i][1]))
+                heads[i] = next(stream, None)
+            else:
+                matched.append([])
+        yield patient, matched
+
+def _report_med_row(med):
+    return {
+        'id': med['id'],
+        'name': med['name'],
+        'dose': med['dose'],
+        'timing': med['timing'],
+        'type': med['type'],
+        'food_relation': med['food_relation'],
+        'is_given_today': med['given_today']
+    }
+
+def _report_adherence(patient, meds, administrations, from_date, to_date):
+    """
+    Per-day adherence for every day the patient was admitted within the
+    range (up to today): the doses each medication's course scheduled that
+    day, and which of them were given, plus totals over those days.
+    """
+    joined = patient['date_of_joining']
+    first, last = max(from_date, joined or from_date), min(to_date, date.today())
+    windows = []
+    for med in meds:
+        window = course_window({**med, 'patient__date_of_joining': joined}, first, last)
+        if window:
+            windows.append((med['id'], *window))
+    logged = {}
+    for day, doses in groupby(administrations, key=itemgetter('date')):
+        logged[day] = {dose['medication_id'] for dose in doses}
+
+    days = []
+    doses_given = doses_scheduled = 0
+    for day in days_between(first, last):
+        due = [med_id for med_id, start, end in windows if start <= day <= end]
+        # Only scheduled doses count, so a stray log entry can't lift adherence past 100%
+        medication_ids = [med_id for med_id in due if med_id in logged.get(day, ())]
+        days.append({
+            'date': day.isoformat(),
+            'given': len(medication_ids),
+            'scheduled': len(due),
+            'percentage': round(len(medication_ids) / len(due) * 100, 1) if due else 0,
+            'medication_ids': medication_ids
+        })
+        doses_given += len(medication_ids)
+        doses_scheduled += len(due)
+    return {
+        'doses_given': doses_given,
+        'doses_scheduled': doses_scheduled,
+        'percentage': round(doses_given / doses_scheduled * 100, 1) if doses_scheduled else 0,
+        'days': days
+    }
+
+def _report_record_row(record):
+    return {
+        'id': record['id'],
+        'patient_id': record['patient_id'],
+        'date': record['date'].isoformat(),
+        'weight': record['weight'],
+        'bp': bp_display(record['bp'], record['bp_systolic'], record['bp_diastolic']),
+        'notes': record['notes']
+    }
+
+def _report_entries(patients, medications, daily_records, administrations, from_date, to_date):
+    joined = _join_by_patient(patients, medications, daily_records, administrations)
+    for patient, (meds, records, doses) in joined:
+        yield {
+            'patient': patient,
+            'medications': [_report_med_row(med) for med in meds],
+            'daily_records': [_report_record_row(record) for record in records],
+            'adherence': _report_adherence(patient, meds, doses, from_date, to_date)
+        }
+
+def _facility_report(patient_id, from_date, to_date):
+    rows = [list(queryset) for queryset in _report_querysets(patient_id, from_date, to_date)]
+    return list(_report_entries(*rows, from_date, to_date))
+
+# Streams cover facilities one after another; unlike the JSON report they
+# hold one patient at a time, so there is nothing to gain from reading ahead.
+# Entries and rows carry their facility when there is more than one.
+
+def _stream_report_ndjson(report_facilities, patient_id, from_date, to_date):
+    for facility in report_facilities:
+        querysets = _report_querysets(patient_id, from_date, to_date)
+        entries = _report_entries(
+            *(qs.iterator(chunk_size=REPORT_CHUNK_SIZE) for qs in querysets),
+            from_date, to_date
+        )
+        for entry in iterate_in_facility(facility, entries):
+            if len(report_facilities) > 1:
+                entry = {'facility': facility, **entry}
+            yield json.dumps(entry, cls=DjangoJSONEncoder) + "\n"
+
+def _stream_report_csv(report_facilities, patient_id, from_date, to_date):
+    tagged = len(report_facilities) > 1
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['facility', *REPORT_CSV_COLUMNS] if tagged else REPORT_CSV_COLUMNS)
+    for facility in report_facilities:
+        records = DailyRecord.objects.filter(date__gte=from_date, date__lte=to_date)
+        if patient_id:
+            records = records.filter(patient_id=patient_id)
+        # Date-major order streams straight off the (date, patient) index without a sort
+        rows = records.order_by('date', 'patient_id').values_list(
+            'patient_id', 'patient__name', 'id', 'date', 'weight',
+            'bp', 'bp_systolic', 'bp_diastolic', 'notes'
+        )
+        for row in iterate_in_facility(facility, rows.iterator(chunk_size=REPORT_CHUNK_SIZE)):
+            yield writer.writerow((facility, *row) if tagged else row)
+
+@all_facilities
+@reads_from_replica
+async def reports_data(request):
     """
     Get patient reports data within a date range
-    Query params: from_date, to_date, patient_id (optional)
+    Query params: from_date, to_date, patient_id (optional),
+    format (optional: json (default), ndjson or csv; the latter two stream)
+    Covers the selected facility, or every facility without X-Facility.
     """
     try:
         from_date_str = request.GET.get('from_date')
         to_date_str = request.GET.get('to_date')
         patient_id = request.GET.get('patient_id')
+        output_format = request.GET.get('format', 'json')
         
         if not from_date_str or not to_date_str:
             return JsonResponse({'error': 'from_date and to_date are required'}, status=400)
@@ -307,54 +940,40 @@ def reports_data(request):
             to_date = date.fromisoformat(to_date_str)
         except ValueError:
             return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
-        
-        # Build query filters
-        patients_query = Patient.objects.all()
-        if patient_id:
-            patients_query = patients_query.filter(id=patient_id)
-        
-        patients_data = []
-        
-        for patient in patients_query:
-            # Get medications for this patient
-            medications = Medication.objects.filter(patient_id=patient.id)
-            
-            # Get daily records within date range
-            daily_records = DailyRecord.objects.filter(
-                patient_id=patient.id,
-                date__gte=from_date,
-                date__lte=to_date
-            ).order_by('date')
-            
-            # Build medication history (which were given on which dates)
-            # Note: is_given_today only tracks today, so we need a different approach
-            # For now, we'll just list all medications and their status
-            meds_data = []
-            for med in medications:
-                meds_data.append({
-                    'id': med.id,
-                    'name': med.name,
-                    'dose': med.dose,
-                    'timing': med.timing,
-                    'type': med.type,
-                    'food_relation': med.food_relation,
-                    'is_given_today': med.is_given_today
-                })
-            
-            # Build daily records data
-            records_data = [record.to_dict() for record in daily_records]
-            
-            patients_data.append({
-                'patient': {
-                    'id': patient.id,
-                    'name': patient.name,
-                    'age': patient.age,
-                    'gender': patient.gender,
-                    'chief_complaint': patient.chief_complaint
-                },
-                'medications': meds_data,
-                'daily_records': records_data
-            })
+        # Checked up front: the streaming formats only query once the 200 is sent
+        try:
+            patient_id = int(patient_id) if patient_id else None
+        except ValueError:
+            return JsonResponse({'error': 'patient_id must be an integer'}, status=400)
+
+        report_facilities = facilities() if fans_out() else [current_facility()]
+        if output_format == 'ndjson':
+            return StreamingHttpResponse(
+                _streaming_content(request, _stream_report_ndjson(report_facilities, patient_id, from_date, to_date)),
+                content_type='application/x-ndjson'
+            )
+        if output_format == 'csv':
+            response = StreamingHttpResponse(
+                _streaming_content(request, _stream_report_csv(report_facilities, patient_id, from_date, to_date)),
+                content_type='text/csv'
+            )
+            response['Content-Disposition'] = f'attachment; filename="report_{from_date_str}_{to_date_str}.csv"'
+            return response
+        if output_format != 'json':
+            return JsonResponse({'error': 'format must be json, ndjson or csv'}, status=400)
+
+        if len(report_facilities) > 1:
+            # One report per facility, read in parallel on the fan-out pool
+            reports = await afan_out(_facility_report, patient_id, from_date, to_date)
+            patients_data = [
+                {'facility': facility, **entry} for facility, entries in reports.items() for entry in entries
+            ]
+        else:
+            # Fetch the four row sets concurrently, then merge them in memory
+            rows = await asyncio.gather(*(
+                _alist(queryset) for queryset in _report_querysets(patient_id, from_date, to_date)
+            ))
+            patients_data = list(_report_entries(*rows, from_date, to_date))
         
         return JsonResponse({
             'from_date': from_date_str,
@@ -365,3 +984,61 @@ def reports_data(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+SYNC_PAGE_SIZE = 1000
+
+async def _sync_cutoff(queryset):
+    """change_seq of the last row that fits on a page, or None if they all fit."""
+    seqs = await _alist(queryset.values_list('change_seq', flat=True)[SYNC_PAGE_SIZE - 1:SYNC_PAGE_SIZE + 1])
+    return seqs[0] if len(seqs) > 1 else None
+
+async def sync(request):
+    """
+    Rows created, changed or deleted since ?since=<cursor> (omit for a full
+    snapshot), at most SYNC_PAGE_SIZE per table. Pass the returned cursor
+    back as `since`; while has_more is true, call again straight away.
+    """
+    try:
+        since = decode_cursor(request.GET['since']) if request.GET.get('since') else 0
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    try:
+        # Everything up to the sequence head read first is committed, so
+        # bounding every table by it gives one consistent cut
+        head = await sync_to_async(current_sequence)()
+        if since > head:
+            return JsonResponse({"error": "Cursor is ahead of this server; resync from scratch"}, status=400)
+
+        changed = [
+            (name, model.objects.filter(change_seq__gt=since, change_seq__lte=head).order_by('change_seq'), serializer)
+            for name, model, serializer in SYNC_RESOURCES
+        ]
+        tombstones = SyncTombstone.objects.filter(change_seq__gt=since, change_seq__lte=head).order_by('change_seq')
+        # A first sync has no local rows to delete
+        querysets = [queryset for _, queryset, _ in changed] + ([tombstones] if since else [])
+
+        # Pages end at the lowest per-table cutoff, so no change is skipped
+        cutoffs = [seq for seq in await asyncio.gather(*map(_sync_cutoff, querysets)) if seq is not None]
+        upto = min(cutoffs, default=head)
+
+        results = await asyncio.gather(*(
+            serializer.aserialize(queryset.filter(change_seq__lte=upto)) for _, queryset, serializer in changed
+        ))
+        deleted = {name: [] for name, _, _ in SYNC_RESOURCES}
+        if since:
+            async for table, object_id in tombstones.filter(change_seq__lte=upto).values_list('table', 'object_id'):
+                deleted[RESOURCE_BY_TABLE[table]].append(object_id)
+
+        return JsonResponse({
+            "cursor": encode_cursor(upto),
+            "has_more": upto < head,
+            **{name: rows for (name, _, _), rows in zip(changed, results)},
+            "deleted": deleted
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@all_facilities
+def metrics(request):
+    """Rolling per-URL-name latency percentiles, SQL totals and cache hit/miss counts, Prometheus text format."""
+    return HttpResponse(registry.render() + cache_stats.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
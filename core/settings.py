@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,6 +53,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.FacilityMiddleware',
+    # Innermost, so the timings cover the view rather than the whole stack
+    'api.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -75,13 +81,66 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite connection profile: each PRAGMA runs on every new connection via the
+# backend's init_command. WAL lets dashboard reads proceed during nurse writes
+# and busy_timeout makes writers wait for the lock instead of failing.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -20000)),  # negative = KiB
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Persistent connections, so the PRAGMAs are paid once per worker
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock at BEGIN so transactions don't deadlock upgrading it
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Care homes, e.g. FACILITIES=main,riverside. Each keeps its patients,
+# medications and records in its own SQLite file, so one home's writes never
+# queue behind another's lock; api.facilities.FacilityRouter picks the file
+# from the request's X-Facility header. The first facility is the default and
+# keeps db.sqlite3; migrate the others with `migrate --database <facility>`.
+# The test suite runs with two facilities by default, so the routing and the
+# cross-facility fan-out are always exercised.
+TESTING = sys.argv[1:2] == ['test']
+FACILITIES = {}
+for index, facility in enumerate(os.environ.get('FACILITIES', 'main,annex' if TESTING else 'main').split(',')):
+    alias = 'default' if index == 0 else facility.strip()
+    FACILITIES[facility.strip()] = alias
+    if alias != 'default':
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': BASE_DIR / f'db_{alias}.sqlite3'}
+
+# Read replicas, primary alias -> replica alias. READ_REPLICAS=1 puts one next
+# to each facility database (db.replica.sqlite3), refreshed from the primary
+# with the SQLite backup API by `manage.py sync_replicas`. GET requests read
+# from the replica until they write; everything else uses the primary.
+# Tests get real (in-memory) replicas too, filled the same way.
+REPLICA_DATABASES = {}
+if os.environ.get('READ_REPLICAS', '1' if TESTING else ''):
+    for alias in list(DATABASES):
+        REPLICA_DATABASES[alias] = f'{alias}_replica'
+        DATABASES[f'{alias}_replica'] = {
+            **DATABASES[alias],
+            'NAME': Path(DATABASES[alias]['NAME']).with_suffix('.replica.sqlite3'),
+        }
+
+DATABASE_ROUTERS = ['api.facilities.FacilityRouter']
+
+# Threads fanning cross-facility reads (dashboard, reports) out to the shards
+FACILITY_FANOUT_WORKERS = int(os.environ.get('FACILITY_FANOUT_WORKERS', 8))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -127,3 +186,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS settings - Allow all origins for development
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'x-facility')
+
+# In-process LRU caches (LocMemCache moves entries to the front on every
+# read and culls from the back once MAX_ENTRIES is reached), so no cache
+# service is needed. patient_json holds serialized per-patient medicine and
+# record lists; entries are keyed by data version, so the timeout only
+# bounds how long unused ones linger.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'patient_json': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'patient_json',
+        'TIMEOUT': int(os.environ.get('PATIENT_JSON_CACHE_TIMEOUT', 3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('PATIENT_JSON_CACHE_ENTRIES', 5000)),
+            # Evict the least recently used tenth when full
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Dashboard snapshot cache lifetime in seconds (0 disables the cache).
+# Writes invalidate the snapshot; the timeout bounds staleness across workers.
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 10))
+
+# Request timing log lines from api.middleware.RequestMetricsMiddleware, one
+# JSON object per request with view, status, duration_ms, db_ms, queries and
+# json_ms as fields. Quiet under test unless METRICS_LOG_LEVEL says otherwise.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'api.metrics.JsonLogFormatter',
+        },
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['metrics'],
+            'level': os.environ.get('METRICS_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -45,7 +45,7 @@ def test_api():
 
     # 4. Get Dashboard
     print("\n4. Testing Dashboard...")
-    response = requests.get(f"{BASE_URL}/home/dashboard")
+    response = requests.get(f"{BASE_URL}/dashboard")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.text}")
 